@@ -0,0 +1,53 @@
+"""
+Measures per-call agent overhead: building a new Agent for every call (old behaviour)
+vs looking it up in the shared registry.
+
+  uv run python -m benchmarks.agent_registry --calls 2000
+"""
+import argparse
+import asyncio
+import statistics
+import time
+
+from pydantic_ai import Agent
+from pydantic_ai.models.test import TestModel
+
+from src.core import chat, search
+
+
+def per_call(label: str, seconds: float, calls: int):
+  print(f'{label:<32} {seconds / calls * 1e6:9.1f} us/call')
+
+
+async def main():
+  parser = argparse.ArgumentParser()
+  parser.add_argument('--calls', type=int, default=2000)
+  args = parser.parse_args()
+  model = TestModel(custom_result_text='<should_be_used>true</should_be_used>')
+
+  start = time.perf_counter()
+  for _ in range(args.calls): Agent(model, system_prompt=search.RESULT_PRUNER_PROMPT, instrument=True)
+  per_call('construct Agent', time.perf_counter() - start, args.calls)
+
+  start = time.perf_counter()
+  for _ in range(args.calls): chat.get_agent(model, search.RESULT_PRUNER_PROMPT, instrument=True)
+  per_call('registry lookup', time.perf_counter() - start, args.calls)
+
+  # sequential chat() round-trips against an instant model, interleaved to even out noise
+  async def old_chat():
+    agent = Agent(model, system_prompt=search.RESULT_PRUNER_PROMPT, instrument=True)
+    return (await agent.run('prompt')).data
+
+  async def new_chat():
+    return await chat.ChatSession(search.RESULT_PRUNER_PROMPT).chat('prompt', model)
+
+  rounds = {'chat() with new Agent per call': [], 'chat() with registry': []}
+  for _ in range(5):
+    for (label, timings), fn in zip(rounds.items(), [old_chat, new_chat]):
+      start = time.perf_counter()
+      for _ in range(args.calls // 5): await fn()
+      timings.append(time.perf_counter() - start)
+  for label, timings in rounds.items(): per_call(label, statistics.median(timings), args.calls // 5)
+
+if __name__ == '__main__':
+  asyncio.run(main())
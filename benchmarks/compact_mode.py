@@ -0,0 +1,114 @@
+"""
+Compares the compact structured-output prompts against the default free-form ones.
+
+Runs query generation, pruning and answering for the same questions and search
+results in both modes, and reports latency, response tokens and parse-failure rate
+per stage. Uses the scripted LLM by default. Pass a registered model to measure a
+real one, e.g. --model qwen7b with ollama running (search results stay synthetic).
+
+  uv run python -m benchmarks.compact_mode --questions 8 --format-error-rate 0.05
+  uv run python -m benchmarks.compact_mode --model flash --questions 4
+"""
+import os
+
+os.environ.setdefault('TELEMETRY_ENABLED', 'false')
+os.environ.setdefault('INSTRUMENT_AGENTS', 'false')
+
+import argparse
+import asyncio
+import json
+import time
+from collections import defaultdict
+
+import numpy as np
+from prometheus_client import REGISTRY
+
+from src.core import models, search
+from src.tools.search import SearchResult
+from src.utils import metrics
+from benchmarks.e2e import make_questions
+from benchmarks.mock_brave import MockBrave
+from benchmarks.mock_llm import ScriptedLLM
+
+STAGES = ['get_queries', 'prune', 'answer']
+
+
+def parse_failures(stage: str) -> float:
+  return sum(REGISTRY.get_sample_value('llm_parse_failures_total', {'stage': x}) or 0.0 for x in [stage, f'{stage}_batch'])
+
+
+async def timed_stage(stats: dict, stage: str, coro):
+  start = time.perf_counter()
+  with metrics.track_request() as usage:
+    result = await coro
+  stats[stage]['latency'].append(time.perf_counter() - start)
+  stats[stage]['response_tokens'].append(usage.response_tokens)
+  stats[stage]['llm_calls'].append(usage.llm_calls)
+  return result
+
+
+async def run_mode(args, compact: bool) -> dict:
+  brave = MockBrave(snippets=2)
+  stats = defaultdict(lambda: defaultdict(list))
+  ss = search.SearchSession(model=args.model, compact=compact, prune_batch_size=args.prune_batch_size)
+
+  async def one(question):
+    await timed_stage(stats, 'get_queries', ss._get_queries(question))
+    results = [SearchResult(**brave._result(question, i)) for i in range(args.results)]
+    kept = await timed_stage(stats, 'prune', ss._prune_search_results(question, results))
+    await timed_stage(stats, 'answer', ss._get_final_answer(question, kept or results[:3], stream=False))
+
+  # questions overlap, so failures are counted over the whole run rather than per call
+  failures = {stage: parse_failures(stage) for stage in STAGES}
+  questions = make_questions(args.questions)
+  for i in range(0, len(questions), args.concurrency):
+    await asyncio.gather(*[one(q) for q in questions[i:i + args.concurrency]])
+  failures = {stage: parse_failures(stage) - failures[stage] for stage in STAGES}
+
+  report = {}
+  for stage in STAGES:
+    s = stats[stage]
+    calls = max(1, sum(s['llm_calls']))
+    report[stage] = dict(
+      latency_p50=float(np.percentile(s['latency'], 50)),
+      latency_p95=float(np.percentile(s['latency'], 95)),
+      response_tokens=float(np.mean(s['response_tokens'])),
+      llm_calls=calls,
+      parse_failure_rate=failures[stage] / calls,
+    )
+  return report
+
+
+def print_report(reports: dict):
+  print(f'{"stage":<12} {"mode":<8} {"p50":>8} {"p95":>8} {"out tokens":>11} {"llm calls":>10} {"parse fail":>11}')
+  for stage in STAGES:
+    for mode, report in reports.items():
+      r = report[stage]
+      print(f'{stage:<12} {mode:<8} {r["latency_p50"]:7.3f}s {r["latency_p95"]:7.3f}s {r["response_tokens"]:11.0f} {r["llm_calls"]:10d} {r["parse_failure_rate"]:10.1%}')
+
+
+def main():
+  parser = argparse.ArgumentParser()
+  parser.add_argument('--model', default='mock', help="registry key, 'mock' for the scripted LLM")
+  parser.add_argument('--questions', type=int, default=8)
+  parser.add_argument('--concurrency', type=int, default=4, help='questions run at once')
+  parser.add_argument('--results', type=int, default=10, help='search results pruned per question')
+  parser.add_argument('--prune-batch-size', type=int, default=1)
+  parser.add_argument('--llm-latency', type=float, default=0.3, help='scripted LLM seconds to first token')
+  parser.add_argument('--tokens-per-second', type=float, default=80.0, help='scripted LLM generation speed')
+  parser.add_argument('--format-error-rate', type=float, default=0.05, help='scripted LLM responses missing the format')
+  parser.add_argument('--output', help='write the report as json')
+  args = parser.parse_args()
+
+  if args.model == 'mock':
+    llm = ScriptedLLM(latency=args.llm_latency, tokens_per_second=args.tokens_per_second, format_error_rate=args.format_error_rate)
+    models.register_model('mock', llm.model)
+
+  reports = {mode: asyncio.run(run_mode(args, compact=mode == 'compact')) for mode in ['verbose', 'compact']}
+  print_report(reports)
+  if args.output:
+    with open(args.output, 'w') as f: json.dump(dict(config=vars(args), **reports), f, indent=2)
+
+
+if __name__ == '__main__':
+  main()
@@ -0,0 +1,228 @@
+"""
+Offline end-to-end benchmark for the search pipeline.
+
+Drives SearchSession.ask, SearchSession.ask_stream or the /api/v1/search endpoint
+with N concurrent users against a local mock Brave server and a scripted LLM, and
+reports per-stage latency percentiles, time-to-first-token, LLM call counts and
+throughput. No API keys or network needed.
+
+  uv run python -m benchmarks.e2e --mode stream --users 8 --questions 4
+  uv run python -m benchmarks.e2e --mode api --output report.json
+  uv run python -m benchmarks.e2e --baseline report.json  # exits 1 on regression
+"""
+import os
+import tempfile
+
+# settings are read once at import, so configure them before importing src
+os.environ.setdefault('BRAVE_SEARCH_AI_API_KEY', 'mock-key')
+os.environ.setdefault('TELEMETRY_ENABLED', 'false')
+os.environ.setdefault('INSTRUMENT_AGENTS', 'false')
+os.environ.setdefault('SEARCH_CACHE_ENABLED', 'false')
+os.environ.setdefault('ANSWER_CACHE_ENABLED', 'false')
+# every search goes to the mock brave, and nothing is written into the working directory
+os.environ.setdefault('SEARCH_PROVIDERS', 'brave')
+os.environ.setdefault('SEARCH_INDEX_PATH', os.path.join(tempfile.mkdtemp(), 'search_index.sqlite3'))
+
+import argparse
+import asyncio
+import functools
+import inspect
+import json
+import sys
+import time
+from collections import defaultdict
+
+import numpy as np
+
+from src import config
+from src.core import models, search
+from src.utils import http
+from benchmarks.mock_brave import MockBrave
+from benchmarks.mock_llm import ScriptedLLM
+
+STAGES = [
+  '_get_queries', '_get_search_results', '_dedupe_search_results', '_prerank_search_results',
+  '_search_and_prune', '_judge_search_results', '_get_final_answer',
+]
+TOPICS = ['aws lambda', 'knative', 'kubernetes', 'cloud run', 'fargate', 'openfaas', 'azure functions', 'nomad']
+
+
+def make_questions(n: int) -> list[str]:
+  return [f'how does {TOPICS[i % len(TOPICS)]} compare to {TOPICS[(i + 3) % len(TOPICS)]}?' for i in range(n)]
+
+
+# records how long every SearchSession stage takes, for whichever path drives it
+class StageTimer:
+  def __init__(self):
+    self.timings = defaultdict(list)
+    self._originals = {}
+
+  def __enter__(self):
+    for name in STAGES:
+      fn = getattr(search.SearchSession, name)
+      self._originals[name] = fn
+      setattr(search.SearchSession, name, self._wrap(name, fn))
+    return self
+
+  def __exit__(self, *exc):
+    for name, fn in self._originals.items(): setattr(search.SearchSession, name, fn)
+
+  def _wrap(self, name, fn):
+    if inspect.iscoroutinefunction(fn):
+      @functools.wraps(fn)
+      async def timed(*args, **kwargs):
+        start = time.perf_counter()
+        try: return await fn(*args, **kwargs)
+        finally: self.timings[name].append(time.perf_counter() - start)
+    else:
+      @functools.wraps(fn)
+      def timed(*args, **kwargs):
+        start = time.perf_counter()
+        try: return fn(*args, **kwargs)
+        finally: self.timings[name].append(time.perf_counter() - start)
+    return timed
+
+
+def percentiles(values: list[float]) -> dict:
+  if not values: return {}
+  p50, p95, p99 = np.percentile(values, [50, 95, 99])
+  return dict(n=len(values), p50=float(p50), p95=float(p95), p99=float(p99), max=float(max(values)))
+
+
+async def run_question(mode: str, question: str, args, api_url: str = None) -> dict:
+  start = time.perf_counter()
+  first_token = None
+
+  if mode == 'api':
+    payload = dict(query=question, model='mock')
+    async with http.get_session().post(api_url, json=payload) as response:
+      response.raise_for_status()
+      async for line in response.content:
+        if first_token is None and line.startswith(b'data: {'): first_token = time.perf_counter() - start
+    return dict(total=time.perf_counter() - start, ttft=first_token)
+
+  ss = search.SearchSession(
+    model='mock', pipeline=args.pipeline, prune_batch_size=args.prune_batch_size,
+    prune_concurrency=args.prune_concurrency, prerank_top_k=args.prerank_top_k,
+  )
+  if mode == 'ask':
+    await ss.ask(question)
+    return dict(total=time.perf_counter() - start, ttft=None)
+
+  async for _ in ss.ask_stream(question):
+    if first_token is None: first_token = time.perf_counter() - start
+  return dict(total=time.perf_counter() - start, ttft=first_token)
+
+
+async def start_api() -> tuple:
+  import uvicorn
+  from src.frontend.app.api import app
+  from src.frontend.app.router import search as search_route
+  search_route.MODEL_MAPPING['mock'] = 'mock'
+
+  server = uvicorn.Server(uvicorn.Config(app, host='127.0.0.1', port=0, log_level='warning', lifespan='off'))
+  task = asyncio.create_task(server.serve())
+  while not server.started: await asyncio.sleep(0.01)
+  port = server.servers[0].sockets[0].getsockname()[1]
+  return server, task, f'http://127.0.0.1:{port}/api/v1/search'
+
+
+async def benchmark(args) -> dict:
+  brave = MockBrave(latency=args.brave_latency, rate_429=args.rate_429, results=args.results)
+  config.settings.BRAVE_SEARCH_URL = await brave.start()
+  if args.brave_rate: config.settings.BRAVE_RATE_LIMIT = args.brave_rate
+  llm = ScriptedLLM(latency=args.llm_latency, tokens_per_second=args.tokens_per_second, num_queries=args.num_queries)
+  models.register_model('mock', llm.model)
+  models.CONCURRENCY_LIMITS['mock'] = args.llm_concurrency
+
+  server = api_url = None
+  if args.mode == 'api': server, server_task, api_url = await start_api()
+
+  questions = make_questions(args.users * args.questions)
+  results = []
+
+  async def user(i):
+    for question in questions[i::args.users]:
+      results.append(await run_question(args.mode, question, args, api_url))
+
+  with StageTimer() as timer:
+    start = time.perf_counter()
+    await asyncio.gather(*[user(i) for i in range(args.users)])
+    wall = time.perf_counter() - start
+
+  if server is not None:
+    server.should_exit = True
+    await server_task
+  await http.close_session()
+  await brave.stop()
+
+  return dict(
+    config=vars(args),
+    questions=len(results),
+    wall_seconds=wall,
+    throughput_qps=len(results) / wall,
+    latency=percentiles([x['total'] for x in results]),
+    ttft=percentiles([x['ttft'] for x in results if x['ttft'] is not None]),
+    stages={name: percentiles(timer.timings[name]) for name in STAGES if timer.timings[name]},
+    llm_calls=dict(llm.calls, total=sum(llm.calls.values()), per_question=sum(llm.calls.values()) / max(1, len(results))),
+    brave=dict(requests=brave.requests, throttled=brave.throttled),
+  )
+
+
+def print_report(report: dict):
+  row = lambda name, p: print(f'  {name:<26} n={p["n"]:<5} p50={p["p50"]:7.3f}s  p95={p["p95"]:7.3f}s  p99={p["p99"]:7.3f}s')
+  print(f'{report["questions"]} questions in {report["wall_seconds"]:.2f}s, {report["throughput_qps"]:.2f} q/s')
+  row('end-to-end', report['latency'])
+  if report['ttft']: row('time to first token', report['ttft'])
+  print('stages:')
+  for name, p in report['stages'].items(): row(name, p)
+  print(f'llm calls: {report["llm_calls"]}')
+  print(f'brave: {report["brave"]}')
+
+
+def check_regression(report: dict, baseline: dict, tolerance: float) -> list[str]:
+  failures = []
+  for key in ['latency', 'ttft']:
+    for p in ['p50', 'p95']:
+      old, new = baseline.get(key, {}).get(p), report.get(key, {}).get(p)
+      if old and new and new > old * (1 + tolerance): failures.append(f'{key}.{p}: {old:.3f}s -> {new:.3f}s')
+  old, new = baseline['llm_calls']['per_question'], report['llm_calls']['per_question']
+  if new > old * (1 + tolerance): failures.append(f'llm_calls.per_question: {old:.1f} -> {new:.1f}')
+  return failures
+
+
+def main():
+  parser = argparse.ArgumentParser()
+  parser.add_argument('--mode', choices=['ask', 'stream', 'api'], default='stream')
+  parser.add_argument('--users', type=int, default=4, help='concurrent users')
+  parser.add_argument('--questions', type=int, default=2, help='questions per user')
+  parser.add_argument('--brave-latency', type=float, default=0.2)
+  parser.add_argument('--rate-429', type=float, default=0.0)
+  parser.add_argument('--brave-rate', type=float, default=None, help='override the brave rate limit, req/s')
+  parser.add_argument('--results', type=int, default=None, help='results per brave response')
+  parser.add_argument('--llm-latency', type=float, default=0.3, help='seconds to first token')
+  parser.add_argument('--tokens-per-second', type=float, default=80.0)
+  parser.add_argument('--num-queries', type=int, default=3)
+  parser.add_argument('--llm-concurrency', type=int, default=models.DEFAULT_CONCURRENCY_LIMIT, help='llm scheduler slots for the scripted model')
+  parser.add_argument('--pipeline', action='store_true')
+  parser.add_argument('--prune-batch-size', type=int, default=1)
+  parser.add_argument('--prune-concurrency', type=int, default=None)
+  parser.add_argument('--prerank-top-k', type=int, default=None)
+  parser.add_argument('--output', help='write the report as json')
+  parser.add_argument('--baseline', help='json report to compare against')
+  parser.add_argument('--tolerance', type=float, default=0.2, help='allowed regression vs baseline')
+  args = parser.parse_args()
+
+  report = asyncio.run(benchmark(args))
+  print_report(report)
+  if args.output:
+    with open(args.output, 'w') as f: json.dump(report, f, indent=2)
+
+  if args.baseline:
+    with open(args.baseline) as f: failures = check_regression(report, json.load(f), args.tolerance)
+    for x in failures: print(f'REGRESSION {x}')
+    sys.exit(1 if failures else 0)
+
+
+if __name__ == '__main__':
+  main()
@@ -0,0 +1,46 @@
+"""
+Checks cold import time of the CLI and the API app against a budget.
+
+Every sample imports the module in a fresh interpreter; the median is compared
+against the budget and the script exits non-zero when any module is over.
+
+  uv run python -m benchmarks.import_time --samples 5
+"""
+import argparse
+import statistics
+import subprocess
+import sys
+
+# seconds, median of cold imports
+BUDGETS = {
+  'main': 1.5,
+  'src.frontend.app.api': 4.0,
+}
+
+SNIPPET = 'import time; t = time.perf_counter(); import {module}; print(time.perf_counter() - t)'
+
+
+def measure(module: str, samples: int) -> float:
+  timings = []
+  for _ in range(samples):
+    out = subprocess.run([sys.executable, '-c', SNIPPET.format(module=module)], capture_output=True, text=True, check=True)
+    timings.append(float(out.stdout.strip().splitlines()[-1]))
+  return statistics.median(timings)
+
+
+def main():
+  parser = argparse.ArgumentParser()
+  parser.add_argument('--samples', type=int, default=5)
+  args = parser.parse_args()
+
+  over = False
+  for module, budget in BUDGETS.items():
+    seconds = measure(module, args.samples)
+    status = 'ok' if seconds <= budget else 'OVER BUDGET'
+    over |= seconds > budget
+    print(f'{module:<24} {seconds:6.2f}s  budget {budget:4.1f}s  {status}')
+  sys.exit(1 if over else 0)
+
+
+if __name__ == '__main__':
+  main()
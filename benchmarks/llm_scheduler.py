@@ -0,0 +1,99 @@
+"""
+Measures interactive time-to-first-token while other requests fan out pruning calls.
+
+A scripted LLM serving a fixed number of calls at once (the rest queue in arrival
+order, like a loaded inference server) gets heavy requests judging many search
+results each, and interactive requests streaming answers that arrive while the heavy
+ones run. Compares sending every call straight to the model with the llm scheduler
+in arrival order and with priorities. No network needed.
+
+  uv run python -m benchmarks.llm_scheduler --heavy 2 --results 50 --answers 8
+"""
+import os
+
+os.environ.setdefault('TELEMETRY_ENABLED', 'false')
+os.environ.setdefault('INSTRUMENT_AGENTS', 'false')
+
+import argparse
+import asyncio
+import json
+import time
+
+import numpy as np
+
+from src.core import llm_scheduler, models, search
+from src.tools.search import SearchResult
+from benchmarks.e2e import make_questions
+from benchmarks.mock_brave import MockBrave
+from benchmarks.mock_llm import ScriptedLLM
+
+SETUPS = {
+  # no client-side limit, every call queues at the server
+  'direct': lambda args: llm_scheduler.LLMScheduler(limits={'mock': 1_000_000}),
+  'fifo': lambda args: llm_scheduler.LLMScheduler(limits={'mock': args.server_slots}, prioritize=False),
+  'priority': lambda args: llm_scheduler.LLMScheduler(limits={'mock': args.server_slots}),
+}
+
+
+async def run_setup(name: str, args) -> dict:
+  llm = ScriptedLLM(latency=args.llm_latency, tokens_per_second=args.tokens_per_second, max_concurrency=args.server_slots)
+  models.register_model('mock', llm.model)
+  llm_scheduler._scheduler = scheduler = SETUPS[name](args)
+  brave = MockBrave(snippets=2)
+  ss = search.SearchSession(model='mock')
+
+  async def heavy(question):
+    results = [SearchResult(**brave._result(question, i)) for i in range(args.results)]
+    start = time.perf_counter()
+    with llm_scheduler.llm_request():
+      await ss._prune_search_results(question, results)
+    return time.perf_counter() - start
+
+  async def answer(question, delay):
+    await asyncio.sleep(delay)
+    results = [SearchResult(**brave._result(question, i)) for i in range(3)]
+    start = time.perf_counter()
+    first = None
+    with llm_scheduler.llm_request():
+      stream = await ss._get_final_answer(question, results, stream=True)
+      async with stream as result:
+        async for _ in result.stream_text(delta=True): first = first or time.perf_counter() - start
+    return first
+
+  questions = make_questions(args.heavy + args.answers)
+  heavies = [asyncio.create_task(heavy(q)) for q in questions[:args.heavy]]
+  answers = [asyncio.create_task(answer(q, i * args.answer_interval)) for i, q in enumerate(questions[args.heavy:])]
+  ttft = await asyncio.gather(*answers)
+  prune = await asyncio.gather(*heavies)
+  return dict(
+    setup=name,
+    ttft_p50=float(np.percentile(ttft, 50)),
+    ttft_p95=float(np.percentile(ttft, 95)),
+    prune_mean=float(np.mean(prune)),
+    prune_max=float(np.max(prune)),
+    scheduler=scheduler.stats().get('mock', {}),
+  )
+
+
+def main():
+  parser = argparse.ArgumentParser()
+  parser.add_argument('--heavy', type=int, default=2, help='requests pruning many results at once')
+  parser.add_argument('--results', type=int, default=50, help='search results each heavy request judges, one call each')
+  parser.add_argument('--answers', type=int, default=8, help='interactive requests streaming an answer')
+  parser.add_argument('--answer-interval', type=float, default=0.25, help='seconds between interactive requests')
+  parser.add_argument('--server-slots', type=int, default=8, help='calls the model serves at once')
+  parser.add_argument('--llm-latency', type=float, default=0.3, help='scripted LLM seconds to first token')
+  parser.add_argument('--tokens-per-second', type=float, default=200.0, help='scripted LLM generation speed')
+  parser.add_argument('--output', help='write the report as json')
+  args = parser.parse_args()
+
+  reports = [asyncio.run(run_setup(name, args)) for name in SETUPS]
+  print(f'{"setup":<10} {"ttft p50":>9} {"ttft p95":>9} {"prune mean":>11} {"prune max":>10}')
+  for r in reports:
+    print(f'{r["setup"]:<10} {r["ttft_p50"]:8.3f}s {r["ttft_p95"]:8.3f}s {r["prune_mean"]:10.3f}s {r["prune_max"]:9.3f}s')
+  if args.output:
+    with open(args.output, 'w') as f: json.dump(dict(config=vars(args), reports=reports), f, indent=2)
+
+
+if __name__ == '__main__':
+  main()
@@ -0,0 +1,121 @@
+"""
+Local stand-in for the Brave web search API.
+
+Serves /res/v1/web/search with configurable latency (and a slow tail), 429 and 5xx
+rates and result sizes.
+Results are deterministic per query, and queries sharing words share URLs, so
+dedup and pre-ranking behave like they do on real traffic.
+
+  uv run python -m benchmarks.mock_brave --port 8099 --latency 0.3 --rate-429 0.05
+"""
+import argparse
+import asyncio
+import hashlib
+import random
+import re
+
+from aiohttp import web
+
+FILLER = (
+  'serverless compute platform runs code in response to events and automatically manages the '
+  'underlying resources scaling from zero to thousands of requests with pay per use pricing'
+).split()
+
+
+class MockBrave:
+  """
+  :param latency: Mean seconds before each response.
+  :param jitter: Latency varies uniformly by +/- this many seconds.
+  :param rate_429: Fraction of requests answered with 429 Too Many Requests.
+  :param rate_5xx: Fraction of requests answered with 503 Service Unavailable.
+  :param slow_rate: Fraction of requests taking slow_latency seconds instead, the latency tail.
+  :param results: Results per response, None to honour the request's count.
+  :param snippets: Extra snippets per result.
+  :param snippet_words: Words per description and snippet.
+  """
+
+  def __init__(self, latency=0.2, jitter=0.05, rate_429=0.0, results=None, snippets=2, snippet_words=40, seed=0,
+               rate_5xx=0.0, slow_rate=0.0, slow_latency=3.0):
+    self.latency = latency
+    self.jitter = jitter
+    self.rate_429 = rate_429
+    self.rate_5xx = rate_5xx
+    self.slow_rate = slow_rate
+    self.slow_latency = slow_latency
+    self.results = results
+    self.snippets = snippets
+    self.snippet_words = snippet_words
+    self.rng = random.Random(seed)
+    self.requests = 0
+    self.throttled = 0
+    self.failed = 0
+    self._runner = None
+
+  def app(self) -> web.Application:
+    app = web.Application()
+    app.router.add_get('/res/v1/web/search', self.search)
+    return app
+
+  async def search(self, request: web.Request) -> web.Response:
+    self.requests += 1
+    latency = self.slow_latency if self.rng.random() < self.slow_rate else self.latency
+    await asyncio.sleep(max(0.0, latency + self.rng.uniform(-self.jitter, self.jitter)))
+    if self.rng.random() < self.rate_429:
+      self.throttled += 1
+      return web.json_response({'error': 'rate limited'}, status=429)
+    if self.rng.random() < self.rate_5xx:
+      self.failed += 1
+      return web.json_response({'error': 'unavailable'}, status=503)
+
+    query = request.query.get('q', '')
+    count = self.results or int(request.query.get('count', 10))
+    return web.json_response({'web': {'results': [self._result(query, i) for i in range(count)]}})
+
+  def _result(self, query: str, i: int) -> dict:
+    words = re.findall(r'\w+', query.lower()) or ['empty']
+    # result i is "about" one query word, so overlapping queries return overlapping urls
+    word = words[i % len(words)]
+    rank = i // len(words)
+    rng = random.Random(hashlib.sha256(f'{word}:{rank}'.encode()).digest())
+    text = lambda: ' '.join([word] + rng.choices(FILLER, k=self.snippet_words - 1))
+    return dict(
+      title=f'{word.title()} guide part {rank}',
+      url=f'https://docs.example.com/{word}/{rank}',
+      description=text(),
+      extra_snippets=[text() for _ in range(self.snippets)],
+    )
+
+  async def start(self, host: str = '127.0.0.1', port: int = 0) -> str:
+    """Starts serving in the current event loop and returns the search endpoint URL."""
+    self._runner = web.AppRunner(self.app())
+    await self._runner.setup()
+    site = web.TCPSite(self._runner, host, port)
+    await site.start()
+    port = self._runner.addresses[0][1]
+    return f'http://{host}:{port}/res/v1/web/search'
+
+  async def stop(self):
+    if self._runner is not None: await self._runner.cleanup()
+
+
+def main():
+  parser = argparse.ArgumentParser()
+  parser.add_argument('--host', default='127.0.0.1')
+  parser.add_argument('--port', type=int, default=8099)
+  parser.add_argument('--latency', type=float, default=0.2)
+  parser.add_argument('--jitter', type=float, default=0.05)
+  parser.add_argument('--rate-429', type=float, default=0.0)
+  parser.add_argument('--rate-5xx', type=float, default=0.0)
+  parser.add_argument('--slow-rate', type=float, default=0.0)
+  parser.add_argument('--slow-latency', type=float, default=3.0)
+  parser.add_argument('--results', type=int, default=None)
+  parser.add_argument('--snippets', type=int, default=2)
+  args = parser.parse_args()
+
+  brave = MockBrave(latency=args.latency, jitter=args.jitter, rate_429=args.rate_429, results=args.results, snippets=args.snippets,
+                    rate_5xx=args.rate_5xx, slow_rate=args.slow_rate, slow_latency=args.slow_latency)
+  web.run_app(brave.app(), host=args.host, port=args.port)
+
+
+if __name__ == '__main__':
+  main()
@@ -0,0 +1,121 @@
+"""
+Scripted pydantic-ai model standing in for the real LLMs.
+
+Recognises which SearchSession stage is calling it from the system prompt and
+answers in that stage's format, after a configurable time-to-first-token and at a
+configurable token rate. Compact prompts get typed results through the result tool.
+A configurable fraction of responses breaks the format. Calls are counted per stage.
+"""
+import asyncio
+import contextlib
+import hashlib
+import random
+import re
+from collections import Counter
+
+from pydantic_ai.messages import ModelResponse, TextPart, ToolCallPart
+from pydantic_ai.models.function import FunctionModel
+
+from src.core import search
+
+ANSWER_FILLER = (
+  'Based on the search results the two services differ mainly in how they are operated '
+  'and billed while sharing the same event driven execution model'
+).split()
+
+
+class ScriptedLLM:
+  """
+  :param latency: Seconds before the first token.
+  :param tokens_per_second: Generation speed after the first token.
+  :param num_queries: Queries returned by the query generation stage.
+  :param keep_ratio: Fraction of search results the pruning stage keeps.
+  :param reasoning_words: Words in each free-form reflection section.
+  :param answer_words: Words in the final answer.
+  :param format_error_rate: Fraction of responses that miss the expected format.
+  :param max_concurrency: Calls served at once, the rest queue in arrival order like on a
+    loaded inference server. None serves every call right away.
+  """
+
+  def __init__(self, latency=0.3, tokens_per_second=80.0, num_queries=3, keep_ratio=0.5, reasoning_words=60, answer_words=150,
+               format_error_rate=0.0, seed=0, max_concurrency=None):
+    self.latency = latency
+    self.tokens_per_second = tokens_per_second
+    self.num_queries = num_queries
+    self.keep_ratio = keep_ratio
+    self.reasoning_words = reasoning_words
+    self.answer_words = answer_words
+    self.format_error_rate = format_error_rate
+    self.rng = random.Random(seed)
+    self.calls = Counter()
+    self.max_concurrency = max_concurrency
+    self._slots = None
+
+  def model(self) -> FunctionModel:
+    return FunctionModel(self._respond, stream_function=self._stream)
+
+  def _keep(self, text: str) -> bool:
+    h = int.from_bytes(hashlib.sha256(text.encode()).digest()[:8], 'big')
+    return h / 2**64 < self.keep_ratio
+
+  def _reasoning(self, tag: str) -> str:
+    return f'<{tag}>\n' + ' '.join(ANSWER_FILLER[i % len(ANSWER_FILLER)] for i in range(self.reasoning_words)) + f'\n</{tag}>\n'
+
+  def _script(self, messages) -> tuple[str, str, object]:
+    """Returns the stage, the text response, and the typed result for compact prompts."""
+    request = messages[0]
+    system_prompt = next((x.content for x in request.parts if x.part_kind == 'system-prompt'), '')
+    prompt = next(x.content for x in request.parts if x.part_kind == 'user-prompt')
+    broken = self.rng.random() < self.format_error_rate
+
+    if system_prompt in (search.QUERY_GENERATOR_PROMPT, search.COMPACT_QUERY_GENERATOR_PROMPT):
+      words = re.findall(r'\w+', prompt.lower())[-self.num_queries:]
+      queries = words + [' '.join(words)]
+      if system_prompt == search.COMPACT_QUERY_GENERATOR_PROMPT: return 'queries', ', '.join(queries), None if broken else queries
+      queries = ''.join(f'<query>{x}</query>' for x in queries)
+      return 'queries', self._reasoning('reflection') + self._reasoning('formulation') + ('' if broken else f'<queries>{queries}</queries>'), None
+
+    if system_prompt in (search.RESULT_BATCH_PRUNER_PROMPT, search.COMPACT_RESULT_BATCH_PRUNER_PROMPT):
+      results = re.findall(r'<search_result id="(\d+)">(.*?)</search_result>', prompt, re.DOTALL)
+      keep = [self._keep(x) for _, x in results]
+      if system_prompt == search.COMPACT_RESULT_BATCH_PRUNER_PROMPT: return 'prune', str(keep), None if broken else keep
+      verdicts = ''.join(f'<should_be_used id="{i}">{str(k).lower()}</should_be_used>' for (i, _), k in zip(results, keep))
+      reasoning = self._reasoning('user_question_reflection') + self._reasoning('result_relation')
+      return 'prune', reasoning + ('' if broken else f'<verdicts>{verdicts}</verdicts>'), None
+
+    if system_prompt in (search.RESULT_PRUNER_PROMPT, search.COMPACT_RESULT_PRUNER_PROMPT):
+      keep = self._keep(prompt.split('<user_question>')[0])
+      if system_prompt == search.COMPACT_RESULT_PRUNER_PROMPT: return 'prune', str(keep), None if broken else keep
+      reasoning = self._reasoning('user_question_reflection') + self._reasoning('search_result_reflection') + self._reasoning('result_relation')
+      return 'prune', reasoning + ('' if broken else f'<should_be_used>{str(keep).lower()}</should_be_used>'), None
+
+    answer = ' '.join(ANSWER_FILLER[i % len(ANSWER_FILLER)] for i in range(self.answer_words))
+    answer = answer if broken else f'<final_answer>\n{answer}\n</final_answer>'
+    if system_prompt == search.COMPACT_ANSWER_GENERATOR_PROMPT: return 'answer', answer, None
+    reasoning = self._reasoning('user_question_reflection') + self._reasoning('context_reflection') + self._reasoning('answer_formulation')
+    return 'answer', reasoning + answer, None
+
+  def _tokens(self, text: str) -> list[str]:
+    return re.findall(r'\s*\S+', text)
+
+  def _server(self):
+    if self.max_concurrency is None: return contextlib.nullcontext()
+    if self._slots is None: self._slots = asyncio.Semaphore(self.max_concurrency)
+    return self._slots
+
+  async def _respond(self, messages, info) -> ModelResponse:
+    stage, text, value = self._script(messages)
+    self.calls[stage] += 1
+    async with self._server(): await asyncio.sleep(self.latency + len(self._tokens(text)) / self.tokens_per_second)
+    # a typed result comes back as a call to the result tool; missing it triggers pydantic-ai's retry
+    if info.result_tools and value is not None: return ModelResponse(parts=[ToolCallPart(info.result_tools[0].name, {'response': value})])
+    return ModelResponse(parts=[TextPart(text)])
+
+  async def _stream(self, messages, info):
+    stage, text, _ = self._script(messages)
+    self.calls[stage] += 1
+    async with self._server():
+      await asyncio.sleep(self.latency)
+      for token in self._tokens(text):
+        await asyncio.sleep(1 / self.tokens_per_second)
+        yield token
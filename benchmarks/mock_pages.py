@@ -0,0 +1,182 @@
+"""
+Local fixture web server for the page fetch stage, and a check of the stage against it.
+
+Serves HTML articles wrapped in navigation/footer boilerplate (with ETags and 304
+revalidation), slow pages, pages that never finish, oversized pages, plain text and
+binary content. Running the module fetches a mix of them cold and warm and reports
+what came back and how long it took. No network needed.
+
+  uv run python -m benchmarks.mock_pages
+  uv run python -m benchmarks.mock_pages --serve --port 8098
+"""
+import os
+
+os.environ.setdefault('TELEMETRY_ENABLED', 'false')
+
+import argparse
+import asyncio
+import hashlib
+import random
+import sys
+import tempfile
+import time
+
+from aiohttp import web
+
+FILLER = (
+  'serverless platforms run functions on demand and bill per invocation while the provider '
+  'manages scaling networking and the underlying servers for every deployed workload'
+).split()
+BOILERPLATE_HEAD = '<html><head><title>{title}</title><script>var x = 1;</script><style>p {{}}</style></head><body>'
+NAV = '<nav><ul>' + ''.join(f'<li><a href="/{i}">Menu item {i}</a></li>' for i in range(20)) + '</ul></nav>'
+FOOTER = '<footer><p>Copyright 2025 Example Corp. All rights reserved. Privacy policy and terms of use apply.</p></footer>'
+
+
+class MockPages:
+  """
+  :param latency: Seconds before each regular page responds.
+  :param slow_latency: Seconds before /slow pages respond.
+  :param paragraphs: Paragraphs of article text per page.
+  """
+
+  def __init__(self, latency=0.05, slow_latency=30.0, paragraphs=8):
+    self.latency = latency
+    self.slow_latency = slow_latency
+    self.paragraphs = paragraphs
+    self.requests = 0
+    self.not_modified = 0
+    self.max_per_host = 0
+    self._in_flight = 0
+    self._runner = None
+
+  def app(self) -> web.Application:
+    app = web.Application()
+    app.router.add_get('/page/{name}', self.page)
+    app.router.add_get('/slow/{name}', self.slow)
+    app.router.add_get('/stall/{name}', self.stall)
+    app.router.add_get('/huge/{name}', self.huge)
+    app.router.add_get('/text/{name}', self.text)
+    app.router.add_get('/binary/{name}', self.binary)
+    return app
+
+  def article(self, name: str) -> str:
+    rng = random.Random(hashlib.sha256(name.encode()).digest())
+    body = ''.join(f'<p>{name} {" ".join(rng.choices(FILLER, k=40))}.</p>' for _ in range(self.paragraphs))
+    return BOILERPLATE_HEAD.format(title=name) + NAV + f'<main><article><h1>About {name}</h1>{body}</article></main>' + FOOTER + '</body></html>'
+
+  async def _serve(self, request: web.Request, latency: float):
+    self.requests += 1
+    await asyncio.sleep(latency)
+
+  async def page(self, request: web.Request) -> web.Response:
+    name = request.match_info['name']
+    etag = '"' + hashlib.sha256(name.encode()).hexdigest()[:16] + '"'
+    self._in_flight += 1
+    self.max_per_host = max(self.max_per_host, self._in_flight)
+    try:
+      await self._serve(request, self.latency)
+    finally:
+      self._in_flight -= 1
+    if request.headers.get('If-None-Match') == etag:
+      self.not_modified += 1
+      return web.Response(status=304, headers={'ETag': etag})
+    return web.Response(text=self.article(name), content_type='text/html', headers={'ETag': etag})
+
+  async def slow(self, request: web.Request) -> web.Response:
+    await self._serve(request, self.slow_latency)
+    return web.Response(text=self.article(request.match_info['name']), content_type='text/html')
+
+  async def stall(self, request: web.Request) -> web.StreamResponse:
+    # sends the headers and a first chunk, then hangs
+    self.requests += 1
+    response = web.StreamResponse(headers={'Content-Type': 'text/html'})
+    await response.prepare(request)
+    await response.write(self.article(request.match_info['name'])[:500].encode())
+    await asyncio.sleep(self.slow_latency)
+    return response
+
+  async def huge(self, request: web.Request) -> web.StreamResponse:
+    # endless markup without text, only the byte cap stops it
+    self.requests += 1
+    response = web.StreamResponse(headers={'Content-Type': 'text/html'})
+    await response.prepare(request)
+    await response.write(b'<html><body>')
+    for _ in range(10_000):
+      await response.write(b'<div><span></span></div>' * 1000)
+    return response
+
+  async def text(self, request: web.Request) -> web.Response:
+    await self._serve(request, self.latency)
+    name = request.match_info['name']
+    rng = random.Random(name)
+    return web.Response(text='\n\n'.join(' '.join(rng.choices(FILLER, k=30)) for _ in range(self.paragraphs)))
+
+  async def binary(self, request: web.Request) -> web.Response:
+    await self._serve(request, self.latency)
+    return web.Response(body=b'%PDF-1.4' + bytes(1000), content_type='application/pdf')
+
+  async def start(self, host: str = '127.0.0.1', port: int = 0) -> str:
+    """Starts serving in the current event loop and returns the base URL."""
+    self._runner = web.AppRunner(self.app())
+    await self._runner.setup()
+    site = web.TCPSite(self._runner, host, port)
+    await site.start()
+    port = self._runner.addresses[0][1]
+    return f'http://{host}:{port}'
+
+  async def stop(self):
+    if self._runner is not None: await self._runner.cleanup()
+
+
+async def check(args) -> bool:
+  from src import config
+  from src.tools import fetch
+  from src.utils import http
+
+  config.settings.PAGE_CACHE_PATH = os.path.join(tempfile.mkdtemp(), 'pages.sqlite3')
+  config.settings.PAGE_CACHE_TTL = 0 # every warm fetch revalidates with its ETag
+  config.settings.PAGE_FETCH_STAGE_TIMEOUT = args.stage_timeout
+  pages = MockPages(latency=args.latency)
+  base = await pages.start()
+
+  # misbehaving pages live on another host name, so they only use up that host's slots
+  other = base.replace('127.0.0.1', 'localhost')
+  urls = [f'{base}/page/p{i}' for i in range(args.pages)] + [f'{base}/text/x0', f'{base}/binary/b0']
+  urls += [f'{other}/slow/s0', f'{other}/stall/t0', f'{other}/huge/h0']
+
+  ok = True
+  for run in ['cold', 'warm']:
+    start = time.perf_counter()
+    texts = await fetch.fetch_pages(urls)
+    elapsed = time.perf_counter() - start
+    print(f'{run}: {len(texts)}/{len(urls)} pages in {elapsed:.2f}s, {pages.not_modified} revalidated, max {pages.max_per_host} concurrent article requests')
+    sample = texts.get(urls[0], '')
+    ok &= elapsed < args.stage_timeout + 1
+    ok &= all(u in texts for u in urls[:args.pages]) and f'{base}/text/x0' in texts
+    ok &= 'Menu item' not in sample and 'Copyright' not in sample and sample.count('\n') + 1 == pages.paragraphs
+    ok &= pages.max_per_host <= config.settings.PAGE_FETCH_PER_HOST
+
+  print('ok' if ok else 'FAILED')
+  await http.close_session()
+  await pages.stop()
+  return ok
+
+
+def main():
+  parser = argparse.ArgumentParser()
+  parser.add_argument('--serve', action='store_true', help='only serve the fixture pages')
+  parser.add_argument('--host', default='127.0.0.1')
+  parser.add_argument('--port', type=int, default=8098)
+  parser.add_argument('--latency', type=float, default=0.05)
+  parser.add_argument('--pages', type=int, default=10)
+  parser.add_argument('--stage-timeout', type=float, default=3.0)
+  args = parser.parse_args()
+
+  if args.serve:
+    web.run_app(MockPages(latency=args.latency).app(), host=args.host, port=args.port)
+  else:
+    sys.exit(0 if asyncio.run(check(args)) else 1)
+
+
+if __name__ == '__main__':
+  main()
@@ -0,0 +1,78 @@
+"""
+Compares end-to-end latency of SearchSession.ask in barrier mode vs pipeline mode.
+
+Brave and the LLM are simulated: searches go through the real shared rate limiter
+and then sleep for --search-latency, every llm call sleeps for --llm-latency.
+
+  uv run python -m benchmarks.pipeline_latency --queries 4 --runs 3 --prune-concurrency 10
+"""
+import argparse
+import asyncio
+import re
+import statistics
+import time
+
+from pydantic_ai.messages import ModelResponse, TextPart
+from pydantic_ai.models.function import FunctionModel
+
+from src import config
+from src.core import search
+from src.tools.search import SearchResult
+
+
+def make_model(llm_latency: float, num_queries: int):
+  async def respond(messages, info):
+    await asyncio.sleep(llm_latency)
+    system_prompt = messages[0].parts[0].content
+    if system_prompt == search.QUERY_GENERATOR_PROMPT:
+      queries = ''.join(f'<query>query {i}</query>' for i in range(num_queries))
+      return ModelResponse(parts=[TextPart(f'<queries>{queries}</queries>')])
+    if system_prompt == search.RESULT_PRUNER_PROMPT:
+      return ModelResponse(parts=[TextPart('<should_be_used>true</should_be_used>')])
+    return ModelResponse(parts=[TextPart('<final_answer>answer</final_answer>')])
+  return FunctionModel(respond)
+
+
+class SimulatedSearchSession(search.SearchSession):
+  search_latency = 0.3
+
+  async def _search(self, query, limiter):
+    await limiter.acquire()
+    await asyncio.sleep(self.search_latency)
+    n = re.sub(r'\D', '', query)
+    return [SearchResult(f'{query} {i}', f'https://example.com/{n}/{i}', f'result {i} of {query}', []) for i in range(10)]
+
+
+async def run(pipeline: bool, args) -> list[float]:
+  SimulatedSearchSession.search_latency = args.search_latency
+  ss = SimulatedSearchSession(
+    model=make_model(args.llm_latency, args.queries), dedup=False, pipeline=pipeline,
+    prune_concurrency=args.prune_concurrency,
+  )
+  timings = []
+  for _ in range(args.runs):
+    start = time.perf_counter()
+    await ss.ask('what is the question?')
+    timings.append(time.perf_counter() - start)
+    await asyncio.sleep(1 / config.settings.BRAVE_RATE_LIMIT) # let the bucket refill
+  return timings
+
+
+async def main():
+  parser = argparse.ArgumentParser()
+  parser.add_argument('--queries', type=int, default=4)
+  parser.add_argument('--runs', type=int, default=3)
+  parser.add_argument('--search-latency', type=float, default=0.3)
+  parser.add_argument('--llm-latency', type=float, default=1.0)
+  parser.add_argument('--prune-concurrency', type=int, default=None)
+  args = parser.parse_args()
+
+  barrier = await run(False, args)
+  pipeline = await run(True, args)
+  for name, timings in [('barrier', barrier), ('pipeline', pipeline)]:
+    print(f'{name:<10} median {statistics.median(timings):6.2f}s  min {min(timings):6.2f}s  max {max(timings):6.2f}s')
+  print(f'reduction  {1 - statistics.median(pipeline) / statistics.median(barrier):6.1%}')
+
+
+if __name__ == '__main__':
+  asyncio.run(main())
@@ -0,0 +1,114 @@
+"""
+Compares search tail latency and failures with and without hedging and failover.
+
+Runs the same queries against the mock Brave API (with a slow tail, 429s and 5xx)
+through three provider setups: brave alone with retries, brave failing over to the
+local index, and brave hedged with the local index. Queries are single terms: mock
+results each contain one word of their query, and the local index only answers
+queries whose every term a result contains. The local index is warmed first
+with a pass over the queries, as if they had been searched before, and each setup
+gets an unmeasured pass so brave's latency stats are filled. No network needed.
+
+  uv run python -m benchmarks.search_hedging --queries 200 --slow-rate 0.05 --rate-429 0.02
+"""
+import os
+
+os.environ.setdefault('BRAVE_SEARCH_AI_API_KEY', 'mock-key')
+os.environ.setdefault('TELEMETRY_ENABLED', 'false')
+
+import argparse
+import asyncio
+import json
+import tempfile
+import time
+
+import numpy as np
+
+from src import config
+from src.tools import search
+from src.utils import http
+from src.utils.cache import SearchIndex
+from benchmarks.e2e import TOPICS
+from benchmarks.mock_brave import MockBrave
+
+
+async def run_setup(name: str, router: search.SearchRouter, queries: list[str], concurrency: int) -> dict:
+  latencies, empty = [], 0
+  answered_by = {}
+  slots = asyncio.Semaphore(concurrency)
+
+  async def one(query):
+    nonlocal empty
+    async with slots:
+      start = time.perf_counter()
+      results, provider = await router.search(query, 10)
+      latencies.append(time.perf_counter() - start)
+    if not results: empty += 1
+    key = provider.name if provider is not None else 'none'
+    answered_by[key] = answered_by.get(key, 0) + 1
+
+  await asyncio.gather(*[one(q) for q in queries])
+  return dict(
+    setup=name,
+    p50=float(np.percentile(latencies, 50)),
+    p95=float(np.percentile(latencies, 95)),
+    p99=float(np.percentile(latencies, 99)),
+    max=float(np.max(latencies)),
+    empty_rate=empty / len(queries),
+    answered_by=answered_by,
+  )
+
+
+async def benchmark(args) -> list[dict]:
+  brave = MockBrave(latency=args.brave_latency, slow_rate=args.slow_rate, slow_latency=args.slow_latency,
+                    rate_429=args.rate_429, rate_5xx=args.rate_5xx)
+  config.settings.BRAVE_SEARCH_URL = await brave.start()
+  index = SearchIndex(os.path.join(tempfile.mkdtemp(), 'index.sqlite3'), max_entries=100_000)
+  terms = [x for topic in TOPICS for x in topic.split()]
+  queries = [terms[i % len(terms)] for i in range(args.queries)]
+
+  # warm the index with error-free searches, as earlier traffic would have
+  rate_429, rate_5xx, slow_rate = brave.rate_429, brave.rate_5xx, brave.slow_rate
+  brave.rate_429 = brave.rate_5xx = brave.slow_rate = 0.0
+  await run_setup('warmup', search.SearchRouter([search.BraveProvider(), search.LocalIndexProvider(index)], hedge=False), queries, args.concurrency)
+  brave.rate_429, brave.rate_5xx, brave.slow_rate = rate_429, rate_5xx, slow_rate
+
+  setups = {
+    'brave': lambda: search.SearchRouter([search.BraveProvider()]),
+    'failover': lambda: search.SearchRouter([search.BraveProvider(), search.LocalIndexProvider(index)], hedge=False),
+    'hedged': lambda: search.SearchRouter([search.BraveProvider(), search.LocalIndexProvider(index)], hedge=True),
+  }
+  reports = []
+  for name, make in setups.items():
+    router = make()
+    # the hedge threshold comes from brave's recent latencies, so every setup gets an unmeasured pass first
+    await run_setup(name, router, queries, args.concurrency)
+    reports.append(await run_setup(name, router, queries, args.concurrency))
+
+  await http.close_session()
+  await brave.stop()
+  return reports
+
+
+def main():
+  parser = argparse.ArgumentParser()
+  parser.add_argument('--queries', type=int, default=200)
+  parser.add_argument('--concurrency', type=int, default=16)
+  parser.add_argument('--brave-latency', type=float, default=0.2)
+  parser.add_argument('--slow-rate', type=float, default=0.05, help='fraction of brave requests in the slow tail')
+  parser.add_argument('--slow-latency', type=float, default=3.0)
+  parser.add_argument('--rate-429', type=float, default=0.02)
+  parser.add_argument('--rate-5xx', type=float, default=0.02)
+  parser.add_argument('--output', help='write the report as json')
+  args = parser.parse_args()
+
+  reports = asyncio.run(benchmark(args))
+  print(f'{"setup":<10} {"p50":>8} {"p95":>8} {"p99":>8} {"max":>8} {"empty":>7}  answered by')
+  for r in reports:
+    print(f'{r["setup"]:<10} {r["p50"]:7.3f}s {r["p95"]:7.3f}s {r["p99"]:7.3f}s {r["max"]:7.3f}s {r["empty_rate"]:6.1%}  {r["answered_by"]}')
+  if args.output:
+    with open(args.output, 'w') as f: json.dump(dict(config=vars(args), reports=reports), f, indent=2)
+
+
+if __name__ == '__main__':
+  main()
@@ -1,16 +1,24 @@
+import argparse
 import asyncio
+import json
 import os
+import sys
+import time
 from typing import Callable
 
 # first-party
 from src import logger
-from src.core import search, models
+from src.core import batch, search, models
+from src.utils import http
 
 class Writer: 
     def __init__(self): self.sinks = []
     def add_sink(self, func: Callable): self.sinks.append(func)
     def write(self, *args, **kwargs):
         for sink in self.sinks: sink(*args, **kwargs)
+    def close(self):
+        for sink in self.sinks:
+            if hasattr(sink, 'close'): sink.close()
 
 
 def write_to_file(user_input, response):
@@ -18,6 +26,12 @@ def write_to_file(user_input, response):
     with open('tmp.txt', 'a') as f: f.write(f'### {user_input}\n\n{response.strip()}\n\n')
 def write_to_stdout(user_input, response): print(response)
 
+class FileSink:
+    """Like write_to_file, but keeps the file open and buffered for a whole session."""
+    def __init__(self, path='tmp.txt'): self.f = open(path, 'a', buffering=64 * 1024)
+    def __call__(self, user_input, response): self.f.write(f'### {user_input}\n\n{response.strip()}\n\n')
+    def close(self): self.f.close()
+
 async def main():
     logger.setup_logging()
     writer = Writer()
@@ -26,11 +40,65 @@ async def main():
 
     ss = search.SearchSession(model=models.Models.FLASH)
     user_input = input('user> ').strip()
-    # res = await ss.ask(user_input, models.Models.QWEN_7B)
-    res = await ss.ask(user_input)
+    try:
+        # res = await ss.ask(user_input, models.Models.QWEN_7B)
+        res = await ss.ask(user_input)
+    finally:
+        await http.close_session()
     writer.write(user_input, res)
 
 
+async def repl(model: str = models.Models.FLASH):
+    """Answers questions in one warm process until EOF or 'exit', streaming every answer as it arrives."""
+    logger.setup_logging()
+    models.get_model(model)  # build the provider once, up front
+    writer = Writer()
+    writer.add_sink(FileSink())
+    answer_cache = search.get_answer_cache()
+    try:
+        while True:
+            try: user_input = input('user> ').strip()
+            except EOFError: break
+            if user_input in ('exit', 'quit'): break
+            if not user_input: continue
+
+            # the http session and agents stay warm between questions, only the pipeline is per question
+            ss = search.SearchSession(model=model, answer_cache=answer_cache)
+            start, first_token, chunks = time.perf_counter(), None, []
+            try:
+                async for chunk in ss.ask_stream(user_input):
+                    if first_token is None: first_token = time.perf_counter() - start
+                    chunks.append(chunk)
+                    sys.stdout.write(chunk)
+                    sys.stdout.flush()
+            except Exception as e:
+                print(f'error: {e}', file=sys.stderr)
+                continue
+            total = time.perf_counter() - start
+            ttft = f'{first_token:.2f}s' if first_token is not None else '-'
+            print(f'\n[first token {ttft}, total {total:.2f}s]', file=sys.stderr)
+            writer.write(user_input, ''.join(chunks))
+    finally:
+        writer.close()
+        await http.close_session()
+
+
+async def batch_main(path: str, output: str = None, model: str = models.Models.FLASH):
+    """Answers every line of `path` (- for stdin) and writes one JSON result per line as each finishes."""
+    logger.setup_logging()
+    with (sys.stdin if path == '-' else open(path)) as f:
+        questions = [x.strip() for x in f if x.strip()]
+
+    out = open(output, 'w') if output else sys.stdout
+    try:
+        async for result in batch.run_batch(questions, model=model, answer_cache=search.get_answer_cache()):
+            out.write(json.dumps(result) + '\n')
+            out.flush()
+    finally:
+        await http.close_session()
+        if output: out.close()
+
+
 async def mock_main():
     writer = Writer()
     writer.add_sink(write_to_file)
@@ -44,4 +112,13 @@ async def mock_main():
 
 
 if __name__ == "__main__":
-    asyncio.run(main())
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--repl', action='store_true', help='keep answering questions in one warm process')
+    parser.add_argument('--batch', metavar='FILE', help='answer one question per line of FILE (- for stdin) as NDJSON')
+    parser.add_argument('--output', help='write batch results here instead of stdout')
+    parser.add_argument('--model', default=models.Models.FLASH)
+    args = parser.parse_args()
+
+    if args.batch: asyncio.run(batch_main(args.batch, args.output, args.model))
+    elif args.repl: asyncio.run(repl(args.model))
+    else: asyncio.run(main())
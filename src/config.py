@@ -1,14 +1,101 @@
 from pydantic_settings import BaseSettings, SettingsConfigDict
+from typing import Optional
 
 
 class Settings(BaseSettings):
     """Configuration settings loaded from environment variables or .env file."""
     
-    # API keys
-    LANGFUSE_PUBLIC_KEY: str
-    LANGFUSE_SECRET_KEY: str
-    GEMINI_API_KEY: str
-    BRAVE_SEARCH_AI_API_KEY: str
+    # API keys, only checked by the feature that needs them
+    LANGFUSE_PUBLIC_KEY: str = ""
+    LANGFUSE_SECRET_KEY: str = ""
+    GEMINI_API_KEY: str = ""
+    TOGETHER_API_KEY: str = ""
+    BRAVE_SEARCH_AI_API_KEY: str = ""
+
+    # Brave search
+    BRAVE_SEARCH_URL: str = "https://api.search.brave.com/res/v1/web/search"
+
+    # Search providers, tried in order: errors fail over to the next, slow responses get hedged with it
+    SEARCH_PROVIDERS: str = "brave,local"  # comma-separated, from: brave, local (index of results seen before)
+    SEARCH_HEDGE_ENABLED: bool = False  # local index answers are stale stand-ins, so only fail over to it by default
+    SEARCH_HEDGE_PERCENTILE: float = 95.0  # a provider slower than this percentile of its recent latencies gets hedged
+    SEARCH_HEDGE_DELAY: float = 2.0  # seconds, hedge threshold until a provider has SEARCH_HEDGE_MIN_SAMPLES latencies
+    SEARCH_HEDGE_MIN_SAMPLES: int = 20
+    SEARCH_LATENCY_WINDOW: int = 200  # recent latencies kept per provider
+    SEARCH_INDEX_PATH: str = ".cache/search_index.sqlite3"
+    SEARCH_INDEX_MAX_ENTRIES: int = 50_000
+    BRAVE_MAX_RETRIES: int = 3  # attempts per brave search once no other provider can answer instead
+
+    # Search result cache
+    SEARCH_CACHE_ENABLED: bool = True
+    SEARCH_CACHE_PATH: str = ".cache/search.sqlite3"
+    SEARCH_CACHE_TTL: float = 24 * 60 * 60  # seconds
+    SEARCH_CACHE_MAX_ENTRIES: int = 10_000
+
+    # Page fetching after pruning, and the cache of extracted page text
+    PAGE_CACHE_ENABLED: bool = True
+    PAGE_CACHE_PATH: str = ".cache/pages.sqlite3"
+    PAGE_CACHE_TTL: float = 24 * 60 * 60  # seconds before a page is revalidated with its ETag
+    PAGE_CACHE_MAX_ENTRIES: int = 5_000
+    PAGE_FETCH_CONCURRENCY: int = 16
+    PAGE_FETCH_PER_HOST: int = 2
+    PAGE_FETCH_MAX_BYTES: int = 1_000_000  # download cap per page
+    PAGE_FETCH_MAX_CHARS: int = 20_000  # extracted text kept per page, download stops once reached
+    PAGE_FETCH_TIMEOUT: float = 4.0  # seconds, whole request per page
+    PAGE_FETCH_STAGE_TIMEOUT: float = 6.0  # seconds, pages not fetched by then are skipped
+
+    # Shared outbound HTTP client
+    HTTP_MAX_CONNECTIONS: int = 100
+    HTTP_MAX_CONNECTIONS_PER_HOST: int = 10
+    HTTP_DNS_CACHE_TTL: int = 300  # seconds
+    HTTP_TIMEOUT: float = 30.0  # seconds, whole request
+    HTTP_CONNECT_TIMEOUT: float = 5.0  # seconds
+
+    # Brave rate limit, shared by every request using the same API key
+    BRAVE_RATE_LIMIT: float = 0.98  # requests per second
+    BRAVE_RATE_CAPACITY: int = 1
+    # Set to a directory to share the budget across worker processes on this host
+    RATE_LIMIT_SHARED_DIR: Optional[str] = None
+
+    # Prune each query's results as soon as its search returns, instead of after every search
+    SEARCH_PIPELINE: bool = False
+
+    # BM25 pre-ranking ahead of llm pruning, for sessions not given their own values; off by default
+    PRERANK_TOP_K: Optional[int] = None  # results passed on to llm pruning, unset keeps all
+    PRERANK_MIN_SCORE: float = 0.0  # min bm25 score to reach llm pruning
+
+    # LLM pruning of search results, for sessions not given their own values
+    PRUNE_BATCH_SIZE: int = 1  # search results judged per llm call
+    PRUNE_CONCURRENCY: Optional[int] = None  # max in-flight pruning calls per question, unset for unbounded
+
+    # Answer cache in front of SearchSession
+    ANSWER_CACHE_ENABLED: bool = True
+    ANSWER_CACHE_TTL: float = 10 * 60  # seconds
+    ANSWER_CACHE_MAX_ENTRIES: int = 1_000
+    ANSWER_CACHE_SEMANTIC: bool = False  # also serve paraphrases; off, only the same normalized question hits
+    ANSWER_CACHE_SIMILARITY: float = 0.9  # min cosine similarity for a paraphrase hit
+
+    # Follow-up conversations kept on the server
+    CONVERSATION_IDLE_TTL: float = 30 * 60  # seconds without a turn before a conversation is dropped
+    CONVERSATION_MAX: int = 1_000  # conversations kept, least recently used ones are dropped first
+    CONVERSATION_HISTORY_BUDGET: int = 1_500  # estimated tokens of history; older turns get summarized
+
+    # Batch search, limits shared by every batch running in the process
+    BATCH_MAX_QUESTIONS: int = 8  # questions answered at once per batch
+    BATCH_MAX_SEARCHES: int = 4  # concurrent brave requests
+    BATCH_MAX_LLM_CALLS: int = 16  # concurrent llm calls
+
+    # Telemetry
+    TELEMETRY_ENABLED: bool = True
+    OTEL_EXPORTER_OTLP_ENDPOINT: str = "http://localhost:3000/api/public/otel"
+    INSTRUMENT_AGENTS: bool = True  # pydantic-ai spans for every llm call
+    TRACE_SAMPLE_RATIO: float = 1.0  # head sampling, decided when a trace starts
+    TRACE_TAIL_SAMPLE_RATIO: float = 1.0  # tail sampling of fast, error-free traces
+    TRACE_TAIL_LATENCY_THRESHOLD: float = 10.0  # seconds, slower traces are always kept
+    TRACE_MAX_QUEUE_SIZE: int = 2048  # spans buffered for export, extra ones are dropped
+    TRACE_MAX_EXPORT_BATCH_SIZE: int = 512
+    TRACE_SCHEDULE_DELAY_MS: int = 5000
+    TRACE_EXPORT_TIMEOUT_MS: int = 10000
     
     # Configure settings to load from .env file
     model_config = SettingsConfigDict(
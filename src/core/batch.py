@@ -0,0 +1,102 @@
+import asyncio
+import time
+from loguru import logger
+
+# first-party
+from src import config
+from src.utils.cache import normalize_query
+from . import chat, models
+from .llm_scheduler import Priority, llm_priority
+from .search import SearchSession
+
+# process-wide, so concurrent batches share the same brave and llm budget
+_search_slots = None
+_llm_slots = None
+
+def get_search_slots():
+  global _search_slots
+  if _search_slots is None: _search_slots = asyncio.Semaphore(config.settings.BATCH_MAX_SEARCHES)
+  return _search_slots
+
+def get_llm_slots():
+  global _llm_slots
+  if _llm_slots is None: _llm_slots = asyncio.Semaphore(config.settings.BATCH_MAX_LLM_CALLS)
+  return _llm_slots
+
+
+class BatchScheduler:
+  """
+  Shared by every question of a batch: runs each distinct sub-query once, however
+  many questions generate it, within the global search concurrency limit.
+  """
+
+  def __init__(self, search_slots=None):
+    self.search_slots = search_slots or get_search_slots()
+    self._searches = {}
+    self.searches_saved = 0
+
+  async def search(self, session, query, limiter):
+    key = normalize_query(query)
+    task = self._searches.get(key)
+    if task is None:
+      task = self._searches[key] = asyncio.create_task(self._search(session, query, limiter))
+    else:
+      self.searches_saved += 1
+    # one question giving up on a search mustn't cancel it for the others
+    return await asyncio.shield(task)
+
+  async def _search(self, session, query, limiter):
+    async with self.search_slots: return await SearchSession._search(session, query, limiter)
+
+
+class BatchSearchSession(SearchSession):
+  def __init__(self, scheduler: BatchScheduler, **kwargs):
+    super().__init__(**kwargs)
+    self.scheduler = scheduler
+
+  async def _search(self, query, limiter):
+    return await self.scheduler.search(self, query, limiter)
+
+
+async def run_batch(questions, model=models.Models.FLASH, max_questions=None, **session_kwargs):
+  """
+  Answers many questions concurrently, yielding results as they finish.
+
+  Brave and llm calls of all questions go through the process-wide batch limits,
+  and identical sub-queries are searched once for the whole batch.
+
+  :param questions: The questions to answer.
+  :param model: Model used for every question.
+  :param max_questions: Questions in progress at once, defaults to BATCH_MAX_QUESTIONS.
+  :param session_kwargs: Passed on to every SearchSession.
+  :return: Async generator of dicts with index, question, answer or error, and latency.
+  """
+  questions = list(questions)
+  scheduler = BatchScheduler()
+  pending = iter(enumerate(questions))
+  finished = asyncio.Queue()
+
+  async def answer(i, question):
+    start = time.perf_counter()
+    ss = BatchSearchSession(scheduler, model=model, **session_kwargs)
+    try:
+      result = dict(answer=await ss.ask(question))
+    except Exception as e:
+      logger.exception(f'Batch question {i} failed')
+      result = dict(error=str(e))
+    return dict(index=i, question=question, **result, latency=time.perf_counter() - start)
+
+  async def worker():
+    for i, question in pending: finished.put_nowait(await answer(i, question))
+
+  # workers copy the context when created, so all their llm calls share the slots
+  # and queue behind interactive requests
+  with chat.limit_llm_calls(get_llm_slots()), llm_priority(Priority.BATCH):
+    # at least one worker, or nothing would ever finish and the results loop waits forever
+    n = max(1, min(max_questions or config.settings.BATCH_MAX_QUESTIONS, len(questions)))
+    workers = [asyncio.create_task(worker()) for _ in range(n)]
+  try:
+    for _ in questions: yield await finished.get()
+  finally:
+    for w in workers: w.cancel()
+    logger.info(f'Batch of {len(questions)} questions saved {scheduler.searches_saved} duplicate searches')
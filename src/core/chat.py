@@ -1,6 +1,41 @@
+import asyncio
+import contextlib
+import contextvars
 from pydantic_ai import Agent
 
+from src import config
+from src.utils import metrics
 from . import models
+from .llm_scheduler import get_llm_scheduler
+
+# agents hold no per-run state, so one per (model, system prompt, result type, instrument)
+# is shared by every session and concurrent run
+_agents = {}
+
+def get_agent(model, system_prompt, instrument=True, result_type=str):
+  # model objects aren't hashable; keying on id() is safe because the cached
+  # agent keeps the model alive, so the id can't be reused
+  key = (model if isinstance(model, str) else id(model), system_prompt, result_type, instrument)
+  agent = _agents.get(key)
+  if agent is None:
+    agent = _agents[key] = Agent(
+      models.get_model(model), result_type=result_type, system_prompt=system_prompt, instrument=instrument
+    )
+  return agent
+
+
+# caps concurrent llm calls made from the current context, e.g. by every question of
+# a batch; tasks spawned inside inherit it
+_llm_slots = contextvars.ContextVar('llm_slots', default=None)
+
+@contextlib.contextmanager
+def limit_llm_calls(slots: asyncio.Semaphore):
+  token = _llm_slots.set(slots)
+  try:
+    yield slots
+  finally:
+    _llm_slots.reset(token)
+
 
 class ChatSession:
   system_prompt = """
@@ -9,20 +44,29 @@ You are a language model, and your job is to help user and address their queries
 Your name is Edith.
   """.strip()
 
-  def __init__(self, system_prompt=None):
+  def __init__(self, system_prompt=None, result_type=str):
     self.message_history = None
+    self.result_type = result_type # anything but str makes the model answer through a typed tool call
     if system_prompt is not None: self.system_prompt = system_prompt
 
   async def stream_chat(self, message, model=models.Models.QWEN_7B):
     agent = self._get_agent(model)
-    return agent.run_stream(message, message_history=self.message_history)
+    return self._record_stream(agent.run_stream(message, message_history=self.message_history), model)
 
   async def chat(self, message, model=models.Models.QWEN_7B):
     agent = self._get_agent(model)
-    result = await agent.run(message, message_history=self.message_history)
+    async with _llm_slots.get() or contextlib.nullcontext(), get_llm_scheduler().slot(model):
+      result = await agent.run(message, message_history=self.message_history)
+    metrics.record_llm_call(result.usage())
     self.message_history = result.all_messages()
     return result.data
 
-  def _get_agent(self, model):
-    return Agent(model, system_prompt=self.system_prompt, instrument=True)
+  @contextlib.asynccontextmanager
+  async def _record_stream(self, stream, model):
+    # a streamed call holds its slots until the stream is consumed
+    async with _llm_slots.get() or contextlib.nullcontext(), get_llm_scheduler().slot(model), stream as result:
+      yield result
+      metrics.record_llm_call(result.usage())
 
+  def _get_agent(self, model):
+    return get_agent(model, self.system_prompt, instrument=config.settings.INSTRUMENT_AGENTS, result_type=self.result_type)
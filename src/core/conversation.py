@@ -0,0 +1,211 @@
+import asyncio
+import time
+import uuid
+from collections import OrderedDict
+from dataclasses import dataclass
+from loguru import logger
+from typing import Optional
+
+# first-party
+from src import config
+from src.utils.cache import normalize_query
+from src.utils.context_packer import estimate_tokens, truncate_to_tokens
+from . import chat, models
+from .search import SearchSession, parse_final_answer
+
+HISTORY_SUMMARIZER_PROMPT = '''
+You are a language model, and your job is to summarize the earlier part of a conversation between a user and a search assistant.
+
+Keep what later questions may refer back to: the topics, entities, facts and conclusions. Drop wording, repetition and pleasantries.
+Write at most {max_words} words of plain text, no preamble.
+
+Your input will be in the following format:
+<summary>summary of the conversation before these turns, if any</summary>
+<turn>
+  <user_question>[...]</user_question>
+  <answer>[...]</answer>
+</turn>
+'''.strip()
+
+MAX_REUSED_SEARCHES = 100
+
+
+@dataclass
+class Turn:
+  question: str
+  answer: str
+
+  def to_xml(self, indent=0) -> str:
+    TAB = '  '
+    return (
+      f'{TAB*indent}<turn>\n'
+      f'{TAB*(indent+1)}<user_question>{self.question}</user_question>\n'
+      f'{TAB*(indent+1)}<answer>{self.answer}</answer>\n'
+      f'{TAB*indent}</turn>'
+    )
+
+
+class Conversation:
+  """
+  State carried from one turn of a conversation to the next: the history, compacted
+  to a token budget by summarizing older turns, and the searches already made.
+
+  :param model: Model summarizing older turns.
+  :param history_budget: Max estimated tokens of history shown to the model.
+  """
+
+  def __init__(self, model=models.Models.FLASH, history_budget: int = None, id: str = None):
+    self.id = id or uuid.uuid4().hex
+    self.model = model
+    self.history_budget = history_budget or config.settings.CONVERSATION_HISTORY_BUDGET
+    self.summary = ''
+    self.turns: list[Turn] = []
+    self.searches = OrderedDict() # normalized query -> search results
+    self.lock = asyncio.Lock() # one turn at a time
+    self.last_used = time.monotonic()
+    self._compaction: Optional[asyncio.Task] = None
+
+  def history_prompt(self) -> str:
+    if not self.summary and not self.turns: return ''
+    parts = ['<conversation_history>']
+    if self.summary: parts.append(f'  <summary>{self.summary}</summary>')
+    parts += [x.to_xml(indent=1) for x in self.turns]
+    parts.append('</conversation_history>')
+    return '\n'.join(parts)
+
+  def ranking_text(self, question: str) -> str:
+    """The question with the summary and earlier questions, which name what a follow-up refers to."""
+    return ' '.join([self.summary, *(x.question for x in self.turns), question]).strip()
+
+  def add_turn(self, question: str, answer: str):
+    self.turns.append(Turn(question, answer))
+    # summarizing takes an llm call; do it in the background, the next turn waits for it
+    if estimate_tokens(self.history_prompt()) > self.history_budget and (self._compaction is None or self._compaction.done()):
+      self._compaction = asyncio.create_task(self.compact())
+
+  async def ready(self):
+    """Waits for a pending compaction of the history."""
+    if self._compaction is not None: await asyncio.shield(self._compaction)
+
+  def get_search(self, query: str) -> Optional[list]:
+    return self.searches.get(normalize_query(query))
+
+  def add_search(self, query: str, results: list):
+    self.searches[normalize_query(query)] = results
+    while len(self.searches) > MAX_REUSED_SEARCHES: self.searches.popitem(last=False)
+
+  async def compact(self):
+    """Folds the older turns into the summary until the history fits its budget. The latest turn is kept verbatim."""
+    while estimate_tokens(self.history_prompt()) > self.history_budget and len(self.turns) > 1:
+      older = self.turns[:max(1, len(self.turns) // 2)]
+      summary_budget = self.history_budget // 2
+      prompt = '\n'.join([f'<summary>{self.summary}</summary>'] + [x.to_xml() for x in older])
+      cs = chat.ChatSession(HISTORY_SUMMARIZER_PROMPT.format(max_words=int(summary_budget * 0.75)))
+      try:
+        summary = await cs.chat(prompt, self.model)
+      except Exception as e:
+        # losing detail beats an ever-growing prompt
+        logger.warning(f'Summarizing conversation {self.id} failed, dropping the oldest turns: {e}')
+        summary = self.summary
+      self.summary = truncate_to_tokens(summary.strip(), summary_budget)
+      self.turns = self.turns[len(older):]
+
+    # a single long turn can still be over budget on its own
+    if estimate_tokens(self.history_prompt()) > self.history_budget and self.turns:
+      last = self.turns[-1]
+      room = max(0, self.history_budget - estimate_tokens(self.summary) - estimate_tokens(last.question) - 40)
+      self.turns[-1] = Turn(last.question, truncate_to_tokens(last.answer, room))
+
+
+class FollowUpSearchSession(SearchSession):
+  """
+  SearchSession answering one turn of a conversation: the model sees the compacted
+  history, searches made by earlier turns are reused, and the answer is added to
+  the conversation. Answers aren't cached, they depend on the conversation.
+  """
+
+  def __init__(self, conversation: Conversation, **kwargs):
+    kwargs['answer_cache'] = None
+    super().__init__(**kwargs)
+    self.conversation = conversation
+    self.reused_searches = 0
+
+  async def _get_context(self, question):
+    await self.conversation.ready()
+    return await super()._get_context(question)
+
+  def _history_prompt(self):
+    return self.conversation.history_prompt()
+
+  def _ranking_query(self, question):
+    # a follow-up like "how is it priced" only names its subject in earlier turns
+    return self.conversation.ranking_text(question)
+
+  async def _search(self, query, limiter):
+    results = self.conversation.get_search(query)
+    if results is not None:
+      self.reused_searches += 1
+      return results
+    results = await super()._search(query, limiter)
+    if results: self.conversation.add_search(query, results)
+    return results
+
+  def _answered(self, question, response):
+    super()._answered(question, response)
+    answer = parse_final_answer(response)
+    if answer is not None: self.conversation.add_turn(question, answer)
+
+
+class ConversationStore:
+  """
+  Server-side conversations by id, dropped after idle_ttl seconds without a turn,
+  or least recently used first beyond max_conversations.
+  """
+
+  def __init__(self, idle_ttl: float, max_conversations: int):
+    self.idle_ttl = idle_ttl
+    self.max_conversations = max_conversations
+    self._conversations: OrderedDict[str, Conversation] = OrderedDict()
+    self.evictions = 0
+
+  def create(self, model=models.Models.FLASH) -> Conversation:
+    self._evict()
+    conversation = Conversation(model=model)
+    self._conversations[conversation.id] = conversation
+    while len(self._conversations) > self.max_conversations:
+      self._conversations.popitem(last=False)
+      self.evictions += 1
+    return conversation
+
+  def get(self, id: str) -> Optional[Conversation]:
+    self._evict()
+    conversation = self._conversations.get(id)
+    if conversation is not None:
+      conversation.last_used = time.monotonic()
+      self._conversations.move_to_end(id)
+    return conversation
+
+  def delete(self, id: str) -> bool:
+    return self._conversations.pop(id, None) is not None
+
+  def _evict(self):
+    # least recently used first, so the idle ones are at the front
+    now = time.monotonic()
+    while self._conversations:
+      id, conversation = next(iter(self._conversations.items()))
+      if now - conversation.last_used <= self.idle_ttl or conversation.lock.locked(): break
+      del self._conversations[id]
+      self.evictions += 1
+
+  def __len__(self):
+    return len(self._conversations)
+
+
+_store = None
+
+def get_conversation_store() -> ConversationStore:
+  """Returns the process-wide conversation store, creating it on first use."""
+  global _store
+  if _store is None:
+    _store = ConversationStore(idle_ttl=config.settings.CONVERSATION_IDLE_TTL, max_conversations=config.settings.CONVERSATION_MAX)
+  return _store
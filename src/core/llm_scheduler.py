@@ -0,0 +1,176 @@
+import asyncio
+import contextlib
+import contextvars
+import time
+from collections import OrderedDict, deque
+from typing import Optional
+
+# first-party
+from src.utils import metrics
+from . import models
+
+
+class Priority:
+  """Lower goes first. Query generation runs as ANSWER, it's on the way to the answer too."""
+  ANSWER = 0
+  PRUNE = 1
+  BATCH = 2
+
+PRIORITY_NAMES = {Priority.ANSWER: 'answer', Priority.PRUNE: 'prune', Priority.BATCH: 'batch'}
+
+
+# priority and request of the llm calls made from the current context; tasks spawned
+# inside inherit them, so every call a request fans out to is queued as that request
+_priority = contextvars.ContextVar('llm_priority', default=Priority.ANSWER)
+_request = contextvars.ContextVar('llm_request', default=None)
+
+@contextlib.contextmanager
+def llm_priority(priority: int):
+  """Runs llm calls from this context at priority, or at the enclosing one if that is lower (e.g. a batch)."""
+  token = _priority.set(max(priority, _priority.get()))
+  try:
+    yield
+  finally:
+    _priority.reset(token)
+
+@contextlib.contextmanager
+def llm_request():
+  """Marks the llm calls from this context as one request, for sharing slots fairly between requests."""
+  token = _request.set(object())
+  try:
+    yield
+  finally:
+    # an abandoned stream may be finalized from another context; nothing left to reset then
+    with contextlib.suppress(ValueError): _request.reset(token)
+
+
+def _model_name(model) -> str:
+  return model if isinstance(model, str) else getattr(model, 'model_name', None) or type(model).__name__
+
+
+class _ModelQueue:
+  # waiting calls by priority, then by request in round robin order, then in arrival order
+  def __init__(self, name: str, limit: int, prioritize: bool):
+    self.name = name
+    self.limit = limit
+    self.prioritize = prioritize
+    self.running = 0
+    self.granted = 0
+    self.waits = {p: deque(maxlen=1_000) for p in PRIORITY_NAMES}
+    self._waiting = {p: OrderedDict() for p in PRIORITY_NAMES} # priority -> request -> deque of futures
+
+  def depth(self, priority: int) -> int:
+    return sum(len(x) for x in self._waiting[priority].values())
+
+  async def acquire(self, priority: int, request):
+    started = time.perf_counter()
+    if self.running < self.limit and not any(self._waiting.values()):
+      self.running += 1
+    else:
+      future = asyncio.get_running_loop().create_future()
+      queue = self._waiting[priority if self.prioritize else Priority.ANSWER]
+      queue.setdefault(request, deque()).append(future)
+      metrics.LLM_QUEUE_DEPTH.labels(self.name, PRIORITY_NAMES[priority]).inc()
+      try:
+        await future
+      except asyncio.CancelledError:
+        if future.done() and not future.cancelled(): self.release() # granted just as it was cancelled
+        else: self._discard(queue, request, future)
+        raise
+      finally:
+        metrics.LLM_QUEUE_DEPTH.labels(self.name, PRIORITY_NAMES[priority]).dec()
+
+    waited = time.perf_counter() - started
+    self.granted += 1
+    self.waits[priority].append(waited)
+    metrics.LLM_QUEUE_WAIT.labels(self.name, PRIORITY_NAMES[priority]).observe(waited)
+    metrics.LLM_RUNNING.labels(self.name).set(self.running)
+
+  def release(self):
+    self.running -= 1
+    while self.running < self.limit:
+      future = self._next()
+      if future is None: break
+      self.running += 1
+      future.set_result(None)
+    metrics.LLM_RUNNING.labels(self.name).set(self.running)
+
+  def _next(self) -> Optional[asyncio.Future]:
+    for queue in self._waiting.values():
+      while queue:
+        request, futures = next(iter(queue.items()))
+        future = futures.popleft()
+        # the request goes to the back of the line, behind the others waiting at this priority
+        del queue[request]
+        if futures: queue[request] = futures
+        if not future.done(): return future
+    return None
+
+  @staticmethod
+  def _discard(queue: OrderedDict, request, future: asyncio.Future):
+    futures = queue.get(request)
+    if futures is None or future not in futures: return
+    futures.remove(future)
+    if not futures: del queue[request]
+
+
+class LLMScheduler:
+  """
+  Admits llm calls within a concurrency limit per model. When a model is at its limit,
+  calls wait in priority order (answers, then pruning, then batch jobs), taking turns
+  between the requests waiting at the same priority so one request's fan-out can't
+  starve the others.
+
+  :param limits: Concurrent calls per model, models.get_concurrency_limit by default.
+  :param prioritize: False queues every call in arrival order (still fair between requests).
+  """
+
+  def __init__(self, limits: Optional[dict] = None, prioritize: bool = True):
+    self.limits = limits or {}
+    self.prioritize = prioritize
+    self._queues: dict[str, _ModelQueue] = {}
+
+  def _queue(self, model) -> _ModelQueue:
+    name = _model_name(model)
+    queue = self._queues.get(name)
+    if queue is None:
+      limit = self.limits.get(name) or models.get_concurrency_limit(model)
+      queue = self._queues[name] = _ModelQueue(name, limit, self.prioritize)
+    return queue
+
+  @contextlib.asynccontextmanager
+  async def slot(self, model):
+    """Holds one of the model's call slots, queued at the current context's priority and request."""
+    queue = self._queue(model)
+    await queue.acquire(_priority.get(), _request.get())
+    try:
+      yield
+    finally:
+      queue.release()
+
+  def stats(self) -> dict:
+    """Per model: its limit, calls running, calls waiting by priority, and wait percentiles by priority."""
+    stats = {}
+    for name, queue in self._queues.items():
+      waits = {}
+      for p, label in PRIORITY_NAMES.items():
+        recent = sorted(queue.waits[p])
+        if not recent: continue
+        waits[label] = dict(p50=recent[len(recent) // 2], p95=recent[min(len(recent) - 1, int(len(recent) * 0.95))])
+      stats[name] = dict(
+        limit=queue.limit,
+        running=queue.running,
+        waiting={label: queue.depth(p) for p, label in PRIORITY_NAMES.items()},
+        granted=queue.granted,
+        wait=waits,
+      )
+    return stats
+
+
+_scheduler = None
+
+def get_llm_scheduler() -> LLMScheduler:
+  """Returns the process-wide llm scheduler, creating it on first use."""
+  global _scheduler
+  if _scheduler is None: _scheduler = LLMScheduler()
+  return _scheduler
@@ -1,36 +1,97 @@
-import os
-from pydantic_ai.models.openai import OpenAIModel
-from pydantic_ai.models.gemini import GeminiModel
-from pydantic_ai.providers.openai import OpenAIProvider
-from pydantic_ai.providers.google_gla import GoogleGLAProvider
-
 from src import config
 
+# providers are built on first use, so importing this module is cheap and a
+# missing api key only fails the model that needs it
+
 
-qwen7b_model = OpenAIModel(
-  model_name='qwen2.5:7b-instruct-q4_K_M',
-  provider=OpenAIProvider(base_url='http://localhost:11434/v1')
-)
-qwen72b_model = OpenAIModel(
-  model_name='Qwen/Qwen2-72B-Instruct',
-  provider=OpenAIProvider(
-    base_url='https://api.together.xyz/v1',
-    api_key=os.environ['TOGETHER_API_KEY']
+def _qwen7b():
+  from pydantic_ai.models.openai import OpenAIModel
+  from pydantic_ai.providers.openai import OpenAIProvider
+  return OpenAIModel(
+    model_name='qwen2.5:7b-instruct-q4_K_M',
+    provider=OpenAIProvider(base_url='http://localhost:11434/v1')
   )
-)
 
-flash_model = GeminiModel(
-  model_name='gemini-2.0-flash',
-  provider=GoogleGLAProvider(
-    api_key=config.settings.GEMINI_API_KEY
+def _qwen72b():
+  from pydantic_ai.models.openai import OpenAIModel
+  from pydantic_ai.providers.openai import OpenAIProvider
+  return OpenAIModel(
+    model_name='Qwen/Qwen2-72B-Instruct',
+    provider=OpenAIProvider(
+      base_url='https://api.together.xyz/v1',
+      api_key=config.settings.TOGETHER_API_KEY or None
+    )
   )
-)
+
+def _flash():
+  from pydantic_ai.models.gemini import GeminiModel
+  from pydantic_ai.providers.google_gla import GoogleGLAProvider
+  return GeminiModel(
+    model_name='gemini-2.0-flash',
+    provider=GoogleGLAProvider(
+      api_key=config.settings.GEMINI_API_KEY or None
+    )
+  )
+
+
+_factories = {
+  'qwen7b': _qwen7b,
+  'qwen72b': _qwen72b,
+  'flash': _flash,
+}
+_models = {}
+
+# estimated tokens of search context each model gets in the answer prompt, leaving
+# room for the system prompt and the answer itself
+CONTEXT_BUDGETS = {
+  'qwen7b': 1_500, # ollama's default 2048 token window
+  'qwen72b': 12_000,
+  'flash': 50_000,
+}
+DEFAULT_CONTEXT_BUDGET = 16_000
+
+# concurrent calls each model is sent, the rest wait their turn in the llm scheduler
+CONCURRENCY_LIMITS = {
+  'qwen7b': 4, # a single local ollama server
+  'qwen72b': 16,
+  'flash': 32,
+}
+DEFAULT_CONCURRENCY_LIMIT = 16
+
+
+def register_model(name, factory):
+  """Registers a zero-argument factory under name, replacing any model already built for it."""
+  _factories[name] = factory
+  _models.pop(name, None)
+
+
+def get_model(model):
+  """
+  Resolves a registry key to its model, constructing it on first use.
+
+  Anything that isn't a registry key (a pydantic-ai model string such as
+  'openai:gpt-4o', or a Model instance) is returned unchanged.
+  """
+  if not isinstance(model, str) or model not in _factories: return model
+  if model not in _models: _models[model] = _factories[model]()
+  return _models[model]
+
+
+def get_context_budget(model):
+  """Returns the search context token budget for a registry key, or the default for anything else."""
+  return CONTEXT_BUDGETS.get(model, DEFAULT_CONTEXT_BUDGET) if isinstance(model, str) else DEFAULT_CONTEXT_BUDGET
+
+
+def get_concurrency_limit(model):
+  """Returns the llm scheduler's concurrency limit for a registry key, or the default for anything else."""
+  return CONCURRENCY_LIMITS.get(model, DEFAULT_CONCURRENCY_LIMIT) if isinstance(model, str) else DEFAULT_CONCURRENCY_LIMIT
+
 
 class Models:
-  QWEN_7B = qwen7b_model
-  QWEN_72B = qwen72b_model
+  QWEN_7B = 'qwen7b'
+  QWEN_72B = 'qwen72b'
   DS_V3 = 'deepseek:deepseek-chat'
-  FLASH = flash_model
+  FLASH = 'flash'
   GEMINI = ''
   SONNET = 'anthropic:claude-3-5-sonnet-latest'
   GPT_4O = 'openai:gpt-4o'
@@ -1,13 +1,22 @@
 import asyncio
+import contextlib
+import dataclasses
 import re
+import time
+from loguru import logger
 from opentelemetry import trace
+from pydantic_ai.exceptions import UnexpectedModelBehavior
 from traceloop.sdk.decorators import workflow, task
 from typing import List
 
 # first-party
 from . import chat, models
-from src.tools import search
-from src.utils import rate_limiter
+from .llm_scheduler import Priority, llm_priority, llm_request
+from src import config
+from src.tools import fetch, search
+from src.utils import context_packer, dedup, metrics, ranking
+from src.utils.answer_cache import AnswerCache
+from src.utils.stream_parser import SectionStreamParser
 
 QUERY_GENERATOR_PROMPT = '''
 You are a language model, and your job is to write google search queries for the given user question.
@@ -75,6 +84,41 @@ Your response will be in the following format:
 <should_be_used>true/false</should_be_used>
 '''.strip()
 
+RESULT_BATCH_PRUNER_PROMPT = '''
+You are a language model and your job is, based on user's question, figure out for each of the google search results if it is a valid search result and would it help in answering user's question.
+
+1. You need to first think out loud and reflect on what the user has asked.
+2. Then for every search_result, you need to think out if and how it is related to the user question.
+3. Finally you need to output, for every search_result id, whether or not it should be used to generate the final answer.
+
+
+Your input will be in the following format:
+<search_result id="1">
+  <title>title of the search result</title>
+  <url>url of the search result</url>
+  <description>brief description of the search result</description>
+  <extra_snippets>additional snippets related to the search result</extra_snippets>
+</search_result>
+<search_result id="2">
+  [...]
+</search_result>
+<user_question>[...]</user_question>
+
+
+Your response will be in the following format:
+<user_question_reflection>
+  [...]
+</user_question_reflection>
+<result_relation>
+  [...]
+</result_relation>
+
+<verdicts>
+  <should_be_used id="1">true/false</should_be_used>
+  <should_be_used id="2">true/false</should_be_used>
+</verdicts>
+'''.strip()
+
 ANSWER_GENERATOR_PROMPT = '''
 You are a language model and your job is, based on user's question and search result, write the final answer for the user.
 
@@ -91,6 +135,7 @@ Your input will be in following format:
     <url>url of the search result</url>
     <description>brief description of the search result</description>
     <extra_snippets>additional snippets related to the search result</extra_snippets>
+    <page_content>main text of the page, when it was fetched</page_content>
   </search_result>
 </context>
 <user_question>[...]</user_question>
@@ -112,6 +157,73 @@ Your response should be in following format:
 '''.strip()
 
 
+# compact variants: typed results or the bare answer, without free-form reasoning.
+# far fewer output tokens, at some cost in judgement quality
+COMPACT_QUERY_GENERATOR_PROMPT = '''
+You are a language model, and your job is to write google search queries for the given user question.
+
+Write between 2 and 5 queries. First split the user question into atomic google searchable queries, then build up compound queries from them.
+  - Example: is knative like aws lambda. Queries like: 'aws lambda', 'knative' and 'aws lambda vs knative'
+
+Return only the list of queries, without any explanation.
+'''.strip()
+
+COMPACT_RESULT_PRUNER_PROMPT = '''
+You are a language model and your job is, based on user's question, figure out if the google search result is a valid search result and would it help in answering user's question.
+
+Your input will be in the following format:
+<search_result>
+  <title>title of the search result</title>
+  <url>url of the search result</url>
+  <description>brief description of the search result</description>
+  <extra_snippets>additional snippets related to the search result</extra_snippets>
+</search_result>
+<user_question>[...]</user_question>
+
+Return only true if the search result should be used to generate the final answer, false otherwise, without any explanation.
+'''.strip()
+
+COMPACT_RESULT_BATCH_PRUNER_PROMPT = '''
+You are a language model and your job is, based on user's question, figure out for each of the google search results if it is a valid search result and would it help in answering user's question.
+
+Your input will be in the following format:
+<search_result id="1">
+  <title>title of the search result</title>
+  <url>url of the search result</url>
+  <description>brief description of the search result</description>
+  <extra_snippets>additional snippets related to the search result</extra_snippets>
+</search_result>
+<search_result id="2">
+  [...]
+</search_result>
+<user_question>[...]</user_question>
+
+Return only a list with one true/false per search_result, in id order: true if it should be used to generate the final answer, false otherwise. No explanation.
+'''.strip()
+
+COMPACT_ANSWER_GENERATOR_PROMPT = '''
+You are a language model and your job is, based on user's question and search result, write the final answer for the user.
+
+Your input will be in following format:
+<context>
+  <search_result>
+    <title>title of the search result</title>
+    <url>url of the search result</url>
+    <description>brief description of the search result</description>
+    <extra_snippets>additional snippets related to the search result</extra_snippets>
+    <page_content>main text of the page, when it was fetched</page_content>
+  </search_result>
+</context>
+<user_question>[...]</user_question>
+
+
+Respond with only the final answer, in the following format:
+<final_answer>
+  [...]
+</final_answer>
+'''.strip()
+
+
 @task()
 def parse_query_response(response: str) -> List[str]:
   """
@@ -133,90 +245,444 @@ def parse_query_response(response: str) -> List[str]:
   return [q.strip() for q in queries]
 
 
+def parse_prune_response(response: str):
+  """
+  Parse the response from result pruner prompt.
+
+  Returns:
+      True/False verdict, or None if the response has no verdict
+  """
+  match = re.search(r'<should_be_used>(.*?)</should_be_used>', response, re.DOTALL)
+  if not match: return None
+  value = match.group(1).strip().lower()
+  if value not in ('true', 'false'): return None
+  return value == 'true'
+
+
+def parse_batch_prune_response(response: str) -> dict:
+  """
+  Parse the response from batch result pruner prompt.
+
+  Returns:
+      Mapping of search result id to its True/False verdict. Ids without a valid verdict are left out.
+  """
+  verdicts = {}
+  for id_, value in re.findall(r'<should_be_used id="(\d+)">(.*?)</should_be_used>', response, re.DOTALL):
+    value = value.strip().lower()
+    if value in ('true', 'false'): verdicts[int(id_)] = value == 'true'
+  return verdicts
+
+
+def parse_final_answer(response: str):
+  """
+  Parse the response from answer generator prompt.
+
+  Returns:
+      The final answer, or None if the response has none
+  """
+  match = re.search(r'<final_answer>(.*?)</final_answer>', response, re.DOTALL)
+  if match: return match.group(1).strip()
+  return None
+
+
+_answer_cache = None
+
+def get_answer_cache():
+  """
+  Returns the process-wide answer cache, creating it on first use.
+
+  Returns:
+      The shared AnswerCache, or None if it is disabled in settings
+  """
+  global _answer_cache
+  if not config.settings.ANSWER_CACHE_ENABLED: return None
+  if _answer_cache is None:
+    _answer_cache = AnswerCache(
+      ttl=config.settings.ANSWER_CACHE_TTL,
+      max_entries=config.settings.ANSWER_CACHE_MAX_ENTRIES,
+      threshold=config.settings.ANSWER_CACHE_SIMILARITY,
+      semantic=config.settings.ANSWER_CACHE_SEMANTIC,
+    )
+  return _answer_cache
+
+
 
 class SearchSession:
-  def __init__(self, model=models.Models.QWEN_7B):
-    self.model = model
+  # with a deadline, the share of it by which each stage must be done. time a stage
+  # doesn't use rolls over to the next; the answer gets whatever is left
+  STAGE_CUTOFFS = {'get_queries': 0.15, 'search': 0.4, 'prune': 0.65, 'fetch_pages': 0.8}
+
+  def __init__(self, model=models.Models.QWEN_7B, dedup=True, prune_batch_size=None, prune_concurrency=None,
+               prerank_top_k=None, prerank_min_score=None, pipeline=None, answer_cache=None, context_budget=None,
+               query_model=None, prune_model=None, cascade=False, fetch_pages=False, compact=False, deadline=None):
+    self.model = model # writes the answer, and does every other stage without a model of its own
+    self.query_model = query_model or model
+    self.prune_model = prune_model or model
+    self.cascade = cascade # redo a query/prune call with self.model when the stage model's output is unusable
+    self.fetch_pages = fetch_pages # add the main text of every kept result's page to the answer context
+    self.compact = compact # typed query/prune results and no free-form reasoning, see COMPACT_*_PROMPT
+    if deadline is not None and deadline <= 0: raise ValueError(f'deadline must be positive, got {deadline}')
+    self.deadline = deadline # seconds to the start of the answer, None for no limit
+    self.degraded = {} # stage -> work cut off at its deadline, for the last question
+    self._started_at = None
+    self.context_budget = context_budget # max estimated tokens of search context, None for the model's default
+    self.answer_cache = answer_cache
+    self.pipeline = pipeline if pipeline is not None else config.settings.SEARCH_PIPELINE # prune each query's results as soon as its search returns
+    self.dedup = dedup
+    # results passed on to llm pruning (None keeps all), and the min bm25 score to reach it; PRERANK_* settings by default
+    self.prerank_top_k = prerank_top_k if prerank_top_k is not None else config.settings.PRERANK_TOP_K
+    self.prerank_min_score = prerank_min_score if prerank_min_score is not None else config.settings.PRERANK_MIN_SCORE
+    # results judged per llm call, and max in-flight pruning calls (None for unbounded); PRUNE_* settings by default
+    self.prune_batch_size = prune_batch_size or config.settings.PRUNE_BATCH_SIZE
+    self.prune_concurrency = prune_concurrency if prune_concurrency is not None else config.settings.PRUNE_CONCURRENCY
 
   @workflow(name='pro-search')
   async def ask(self, question):
-    queries = await self._get_queries(question)
-    search_results = await self._get_search_results(queries)
-    pruned_search_results = await self._prune_search_results(question, search_results)
-    final_answer = await self._get_final_answer(question, pruned_search_results, stream=False)
-    return final_answer
+    with metrics.track_request(), llm_request():
+      cached = self._get_cached_answer(question)
+      if cached is not None: return parse_final_answer(cached)
+
+      pruned_search_results = await self._get_context(question)
+      with metrics.time_stage('get_final_answer'):
+        response = await self._get_final_answer(question, pruned_search_results, stream=False)
+      self._answered(question, response)
+      return parse_final_answer(response)
 
-  @workflow(name='pro-search')
   async def ask_stream(self, question):
-    queries = await self._get_queries(question)
-    search_results = await self._get_search_results(queries)
-    pruned_search_results = await self._prune_search_results(question, search_results)
-    final_answer = await self._get_final_answer(question, pruned_search_results, stream=True)
+    """Streams only the final answer, as soon as the model starts writing it."""
+    answered = False
+    untagged = []
+    async for section, text in self.ask_stream_sections(question):
+      if section == 'final_answer':
+        answered = True
+        yield text
+      elif section is None:
+        untagged.append(text)
+
+    # model ignored the response format, the untagged text is the best answer we have
+    if not answered and ''.join(untagged).strip(): yield ''.join(untagged).strip()
 
-    complete_response = []
-    async with final_answer as result:
-      async for chunk in result.stream_text(delta=True):
-        complete_response.append(chunk)
-        yield chunk
+  @workflow(name='pro-search')
+  async def ask_stream_sections(self, question):
+    """Streams the answer as (section, text) pairs, e.g. ('context_reflection', '...') or ('final_answer', '...')."""
+    parser = SectionStreamParser()
+    async for chunk in self._stream_response(question):
+      for event in parser.feed(chunk): yield event
+    for event in parser.close(): yield event
+
+  async def _stream_response(self, question):
+    with metrics.track_request(), llm_request():
+      cached = self._get_cached_answer(question)
+      if cached is not None:
+        # replay in word-sized chunks so clients render it like a live answer
+        for chunk in re.findall(r'\s*\S+', cached): yield chunk
+        return
+
+      pruned_search_results = await self._get_context(question)
+      complete_response = []
+      with metrics.time_stage('get_final_answer'):
+        final_answer = await self._get_final_answer(question, pruned_search_results, stream=True)
+        async with final_answer as result:
+          async for chunk in result.stream_text(delta=True):
+            complete_response.append(chunk)
+            yield chunk
 
     full = ''.join(complete_response)
+    self._answered(question, full)
     current_span = trace.get_current_span()
     current_span.set_attribute("traceloop.entity.output", full)
 
+  def _cache_namespace(self):
+    # answers are only interchangeable between sessions using the same models and the
+    # options that change what the answer is based on
+    name = lambda m: getattr(m, 'model_name', None) or str(m)
+    options = [name(self.model), name(self.query_model), name(self.prune_model), self.cascade, self.fetch_pages,
+               self.compact, self.dedup, self.prerank_top_k, self.prerank_min_score, self.context_budget]
+    return '|'.join(str(x) for x in options)
+
+  def _get_cached_answer(self, question):
+    if self.answer_cache is None: return None
+    cached = self.answer_cache.get(question, self._cache_namespace())
+    trace.get_current_span().set_attribute('answer_cache.hit', cached is not None)
+    return cached
+
+  def _answered(self, question, response):
+    """Called with the raw response once a question was answered live (not from the cache)."""
+    if parse_final_answer(response) is None: metrics.PARSE_FAILURES.labels('answer').inc()
+    self._cache_answer(question, response)
+
+  def _cache_answer(self, question, response):
+    if self.answer_cache is None or parse_final_answer(response) is None: return
+    # an answer from stages cut short at the deadline must not be served as a full one
+    if self.degraded: return
+    self.answer_cache.put(question, response, self._cache_namespace())
+
   @task()
+  @metrics.timed('get_queries')
   async def _get_queries(self, question):
-    query_gen_chat = chat.ChatSession(QUERY_GENERATOR_PROMPT)
-    res = await query_gen_chat.chat(question, self.model)
-    return parse_query_response(res)
+    queries = await self._generate_queries(question, self.query_model)
+    if len(queries) < 2 and self._can_escalate(self.query_model):
+      self._record_escalation('get_queries')
+      queries = await self._generate_queries(question, self.model) or queries
+    return queries
+
+  async def _generate_queries(self, question, model):
+    if self._history_prompt(): question = self._question_prompt(question)
+    if self.compact:
+      queries = await self._typed_chat(COMPACT_QUERY_GENERATOR_PROMPT, list[str], question, model) or []
+      queries = [q.strip() for q in queries if q.strip()]
+    else:
+      res = await chat.ChatSession(QUERY_GENERATOR_PROMPT).chat(question, model)
+      queries = parse_query_response(res)
+    # the prompt asks for at least 2 queries, fewer means the model lost the format
+    if len(queries) < 2: metrics.PARSE_FAILURES.labels('get_queries').inc()
+    return queries
+
+  async def _typed_chat(self, system_prompt, result_type, prompt, model, slots=None):
+    """Returns the model's typed result, or None if it didn't produce a valid one."""
+    cs = chat.ChatSession(system_prompt, result_type=result_type)
+    try:
+      async with slots or contextlib.nullcontext(): return await cs.chat(prompt, model)
+    except UnexpectedModelBehavior as e:
+      logger.warning(f'No valid {result_type} result: {e}')
+      metrics.record_llm_call() # still a call we paid for, even without its usage
+      return None
+
+  def _history_prompt(self):
+    """Earlier turns of the conversation to show the model ahead of the question, if any."""
+    return ''
+
+  def _question_prompt(self, question):
+    """The question as every stage's model sees it, after the conversation history if there is one."""
+    return '\n'.join(x for x in [self._history_prompt(), f'<user_question>{question}</user_question>'] if x)
+
+  def _ranking_query(self, question):
+    """Text search results are scored against with BM25, for pre-ranking and context packing."""
+    return question
+
+  def _can_escalate(self, stage_model):
+    return self.cascade and stage_model != self.model
+
+  def _record_escalation(self, stage):
+    logger.info(f'Escalating {stage} to {self.model}')
+    metrics.CASCADE_ESCALATIONS.labels(stage).inc()
+    trace.get_current_span().set_attribute('cascade.escalated', True)
+
+  async def _get_context(self, question):
+    self._started_at = time.monotonic()
+    self.degraded = {}
+    try:
+      queries = await asyncio.wait_for(self._get_queries(question), self._stage_timeout('get_queries'))
+    except asyncio.TimeoutError:
+      # no time to plan searches, the question itself is the best query we have
+      self._degrade('get_queries', 1)
+      queries = [question]
+
+    if self.pipeline:
+      search_results = await self._search_and_prune(question, queries)
+    else:
+      search_results = await self._get_search_results(queries)
+      search_results = self._dedupe_search_results(search_results)
+      search_results = self._prerank_search_results(question, search_results)
+      search_results = await self._prune_search_results(question, search_results)
+    if self.fetch_pages: search_results = await self._fetch_pages(search_results)
+    if self.degraded: trace.get_current_span().set_attribute('deadline.degraded', list(self.degraded))
+    return search_results
+
+  def _stage_timeout(self, stage):
+    """Seconds left until the stage's cutoff, or None without a deadline."""
+    if self.deadline is None or self._started_at is None: return None
+    cutoff = self._started_at + self.deadline * self.STAGE_CUTOFFS[stage]
+    return max(0.0, cutoff - time.monotonic())
+
+  def _degrade(self, stage, dropped):
+    logger.warning(f'Deadline hit in {stage}, cut off {dropped} pending')
+    self.degraded[stage] = self.degraded.get(stage, 0) + dropped
+    metrics.DEADLINE_DEGRADED.labels(stage).inc()
+
+  async def _wait_stage(self, stage, tasks):
+    """Waits for the tasks until the stage's cutoff and cancels the stragglers. Returns the finished tasks."""
+    if not tasks: return set()
+    try:
+      done, pending = await asyncio.wait(tasks, timeout=self._stage_timeout(stage))
+    finally:
+      for t in tasks: t.cancel()
+    if pending: self._degrade(stage, len(pending))
+    return done
+
+  async def _search(self, query, limiter):
+    return await search.search_web(query, count=10, rate_limiter=limiter)
 
   @task()
+  @metrics.timed('get_search_results')
   async def _get_search_results(self, queries):
-    limiter = rate_limiter.RateLimiter(rate=0.98, capacity=1)
-    tasks = [search.search_brave(q, count=10, rate_limiter=limiter) for q in queries]
-    search_results: list[list[search.SearchResult]] = await asyncio.gather(*tasks)
+    limiter = search.get_brave_rate_limiter()
+    tasks = [asyncio.create_task(self._search(q, limiter)) for q in queries]
+    done = await self._wait_stage('search', tasks)
+    search_results: list[list[search.SearchResult]] = [t.result() for t in tasks if t in done]
     return [x for y in search_results for x in y]
 
   @task()
-  async def _prune_search_results(self, question, search_results):
-    user_question = f'<user_question>{question}</user_question>'
-    tasks = []
-    for res in search_results:
-      xml_res = self.search_result_to_xml(res)
-      prompt = f'{xml_res}\n{user_question}'
-      cs = chat.ChatSession(RESULT_PRUNER_PROMPT)
-      tasks.append(cs.chat(prompt, self.model))
+  @metrics.timed('search_and_prune')
+  async def _search_and_prune(self, question, queries):
+    # pipelined version of search -> dedup -> prerank -> prune. every query's results
+    # go to pruning as soon as its search returns instead of waiting on the slowest
+    # search. pre-ranking therefore applies top_k per query rather than overall.
+    start = time.perf_counter()
+    limiter = search.get_brave_rate_limiter()
+    deduper = dedup.Deduper() if self.dedup else None
+    slots = asyncio.Semaphore(self.prune_concurrency) if self.prune_concurrency else None
+    searches = [asyncio.create_task(self._search(q, limiter)) for q in queries]
+    pruning = [] # (kept, unjudged) per query
+    first_search_at = None
+    try:
+      try:
+        for next_search in asyncio.as_completed(searches, timeout=self._stage_timeout('search')):
+          search_results = await next_search
+          if first_search_at is None: first_search_at = time.perf_counter() - start
+          if deduper is not None: search_results = deduper.filter(search_results)
+          search_results = self._prerank_search_results(question, search_results)
+          if search_results: pruning.append(asyncio.create_task(self._judge_search_results(question, search_results, slots)))
+      except asyncio.TimeoutError:
+        self._degrade('search', sum(not t.done() for t in searches))
+        # stop spending rate-limiter tokens and quota on results nobody waits for
+        for t in searches: t.cancel()
+      # every pruning call stops at the prune cutoff on its own
+      verdicts = await asyncio.gather(*pruning)
+    finally:
+      for t in searches + pruning: t.cancel()
+
+    span = trace.get_current_span()
+    span.set_attribute('pipeline.first_search_latency', first_search_at or 0.0)
+    span.set_attribute('pipeline.latency', time.perf_counter() - start)
+    if deduper is not None: span.set_attribute('dedup.prune_calls_saved', deduper.removed)
+    kept = [x for y, _ in verdicts for x in y]
+    # unvetted results only stand in when no query kept anything
+    return kept or [x for _, y in verdicts for x in y]
+
+  @task()
+  @metrics.timed('fetch_pages')
+  async def _fetch_pages(self, search_results):
+    pages = await fetch.fetch_pages([x.url for x in search_results], timeout=self._stage_timeout('fetch_pages'))
+    logger.info(f'Fetched {len(pages)}/{len(search_results)} pages')
+    trace.get_current_span().set_attribute('fetch_pages.fetched', len(pages))
+    return [dataclasses.replace(x, page_text=pages[x.url]) if x.url in pages else x for x in search_results]
 
-    responses_list = await asyncio.gather(*tasks)
-    pruned_results_list = []
-    for i, response in enumerate(responses_list):
-      match = re.search(r'<should_be_used>(.*?)</should_be_used>', response, re.DOTALL)
-      if match:
-        value = match.group(1).strip().lower()
-        if value == 'true':
-          pruned_results_list.append(search_results[i])
+  @task()
+  @metrics.timed('dedupe_search_results')
+  def _dedupe_search_results(self, search_results):
+    if not self.dedup: return search_results
+    deduper = dedup.Deduper()
+    deduped = deduper.filter(search_results)
+    # every dropped duplicate is one pruning llm call we don't make
+    logger.info(f'Dedup removed {deduper.removed}/{len(search_results)} search results')
+    trace.get_current_span().set_attribute('dedup.prune_calls_saved', deduper.removed)
+    return deduped
 
-    return pruned_results_list
+  @task()
+  @metrics.timed('prerank_search_results')
+  def _prerank_search_results(self, question, search_results):
+    if self.prerank_top_k is None and self.prerank_min_score <= 0: return search_results
+    documents = [' '.join([x.title, x.description, *x.extra_snippets]) for x in search_results]
+    ranked = ranking.shortlist(self._ranking_query(question), documents, top_k=self.prerank_top_k, min_score=self.prerank_min_score)
+    logger.info(f'Pre-ranking kept {len(ranked)}/{len(search_results)} search results')
+    span = trace.get_current_span()
+    span.set_attribute('prerank.kept', len(ranked))
+    span.set_attribute('prerank.urls', [search_results[i].url for i, _ in ranked])
+    span.set_attribute('prerank.scores', [score for _, score in ranked])
+    return [search_results[i] for i, _ in ranked]
+
+  async def _prune_search_results(self, question, search_results, slots=None):
+    kept, unjudged = await self._judge_search_results(question, search_results, slots)
+    # better to answer from unvetted results than from nothing
+    return kept or unjudged
+
+  @task()
+  @metrics.timed('prune_search_results')
+  async def _judge_search_results(self, question, search_results, slots=None):
+    """Returns the results judged relevant, and the ones still unjudged at the prune cutoff."""
+    if slots is None and self.prune_concurrency: slots = asyncio.Semaphore(self.prune_concurrency)
+    size = max(1, self.prune_batch_size)
+    batches = [search_results[i:i+size] for i in range(0, len(search_results), size)]
+    # judges queue behind answers for the llm; each task keeps the priority it was created with
+    with llm_priority(Priority.PRUNE):
+      if size == 1:
+        tasks = [asyncio.create_task(self._judge_result(question, res, slots)) for res in search_results]
+      else:
+        tasks = [asyncio.create_task(self._judge_batch(question, batch, slots)) for batch in batches]
+
+    done = await self._wait_stage('prune', tasks)
+    # None for results still being judged at the deadline
+    verdicts = [(t.result() if t in done else None) for t in tasks]
+    if size > 1: verdicts = [x for y, batch in zip(verdicts, batches) for x in (y or [None] * len(batch))]
+    kept = [res for res, keep in zip(search_results, verdicts) if keep]
+    unjudged = [res for res, keep in zip(search_results, verdicts) if keep is None]
+    metrics.PRUNE_VERDICTS.labels('kept').inc(len(kept))
+    metrics.PRUNE_VERDICTS.labels('pruned').inc(len(search_results) - len(kept) - len(unjudged))
+    return kept, unjudged
+
+  async def _judge_result(self, question, res, slots=None):
+    xml_res = self.search_result_to_xml(res)
+    prompt = f'{xml_res}\n{self._question_prompt(question)}'
+    verdict = await self._judge(prompt, self.prune_model, slots)
+    # no clear true/false, e.g. a malformed or hedged verdict
+    if verdict is None and self._can_escalate(self.prune_model):
+      self._record_escalation('prune')
+      verdict = await self._judge(prompt, self.model, slots)
+    return bool(verdict)
+
+  async def _judge(self, prompt, model, slots=None):
+    if self.compact:
+      verdict = await self._typed_chat(COMPACT_RESULT_PRUNER_PROMPT, bool, prompt, model, slots)
+    else:
+      cs = chat.ChatSession(RESULT_PRUNER_PROMPT)
+      async with slots or contextlib.nullcontext(): response = await cs.chat(prompt, model)
+      verdict = parse_prune_response(response)
+    if verdict is None: metrics.PARSE_FAILURES.labels('prune').inc()
+    return verdict
+
+  async def _judge_batch(self, question, batch, slots=None):
+    xml_res = '\n'.join(self.search_result_to_xml(res, id=i+1) for i, res in enumerate(batch))
+    prompt = f'{xml_res}\n{self._question_prompt(question)}'
+    if self.compact:
+      flags = await self._typed_chat(COMPACT_RESULT_BATCH_PRUNER_PROMPT, list[bool], prompt, self.prune_model, slots) or []
+      # can't tell which verdict belongs to which result if the count is off
+      verdicts = {i+1: v for i, v in enumerate(flags)} if len(flags) == len(batch) else {}
+    else:
+      cs = chat.ChatSession(RESULT_BATCH_PRUNER_PROMPT)
+      async with slots or contextlib.nullcontext(): response = await cs.chat(prompt, self.prune_model)
+      verdicts = parse_batch_prune_response(response)
+
+    missing = [i for i in range(len(batch)) if i+1 not in verdicts]
+    if missing:
+      metrics.PARSE_FAILURES.labels('prune_batch').inc(len(missing))
+      # couldn't parse every verdict, judge the leftovers one by one
+      logger.warning(f'Batch pruning missed {len(missing)}/{len(batch)} verdicts, falling back to per-result judging')
+      fallback = await asyncio.gather(*[self._judge_result(question, batch[i], slots) for i in missing])
+      verdicts.update({i+1: v for i, v in zip(missing, fallback)})
+    return [verdicts[i+1] for i in range(len(batch))]
 
 
   @task()
   async def _get_final_answer(self, question, search_results, stream):
+    budget = self.context_budget or models.get_context_budget(self.model)
+    search_results, stats = context_packer.pack_results(self._ranking_query(question), search_results, budget)
+    span = trace.get_current_span()
+    for k, v in stats.items(): span.set_attribute(f'context.{k}', v)
+    logger.info(f"Packed context into ~{stats['tokens_after']}/{budget} tokens ({stats['tokens_before']} before)")
+
     search_results = [self.search_result_to_xml(x, indent=1) for x in search_results]
     context = '<context>\n' + '\n'.join(search_results) + '\n</context>'
-    user_question = f'<user_question>{question}</user_question>'
-    prompt = context + '\n' + user_question
+    prompt = context + '\n' + self._question_prompt(question)
 
-    cs = chat.ChatSession(ANSWER_GENERATOR_PROMPT)
+    cs = chat.ChatSession(COMPACT_ANSWER_GENERATOR_PROMPT if self.compact else ANSWER_GENERATOR_PROMPT)
     if stream: return await cs.stream_chat(prompt, self.model) # Get the async generator
-    response = await cs.chat(prompt, self.model)
-    match = re.search(r'<final_answer>(.*?)</final_answer>', response, re.DOTALL)
-    if match: return match.group(1).strip()
-
-    return None
+    return await cs.chat(prompt, self.model)
 
 
-  def search_result_to_xml(self, res: search.SearchResult, indent=0):
+  def search_result_to_xml(self, res: search.SearchResult, indent=0, id=None):
     TAB = '  '
-    ret = [f'{TAB*(indent)}<search_result']
+    ret = [f'{TAB*(indent)}<search_result>' if id is None else f'{TAB*(indent)}<search_result id="{id}">']
     ret.append(f'{TAB*(indent+1)}<title>{res.title}</title>')
     ret.append(f'{TAB*(indent+1)}<url>{res.url}</url>')
     ret.append(f'{TAB*(indent+1)}<description>{res.description}</description>')
@@ -225,5 +691,7 @@ class SearchSession:
       for x in res.extra_snippets:
         ret.append(f'{TAB*(indent+2)}<snippet>{x}</snippet>')
       ret.append(f'{TAB*(indent+1)}</extra_snippet>')
+    if res.page_text:
+      ret.append(f'{TAB*(indent+1)}<page_content>{res.page_text}</page_content>')
     ret.append(f'{TAB*(indent)}</search_result>')
     return '\n'.join(ret)
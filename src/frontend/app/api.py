@@ -3,17 +3,29 @@ from src import logger
 load_dotenv('.env')
 logger.setup_logging()
 
+from contextlib import asynccontextmanager
 from fastapi import FastAPI
 from fastapi.middleware.cors import CORSMiddleware
 
 # first-party
-from .router import search_router
+from src.utils import http
+from .router import metrics_router, search_router
+
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    # the pooled http client lives as long as the app
+    http.get_session()
+    yield
+    await http.close_session()
+
 
 # Create FastAPI app
 app = FastAPI(
     title="Search API",
     version="1.0.0",
-    description="API for performing searches using various language models"
+    description="API for performing searches using various language models",
+    lifespan=lifespan,
 )
 
 # Configure CORS
@@ -27,6 +39,7 @@ app.add_middleware(
 
 # Register routers
 app.include_router(search_router)
+app.include_router(metrics_router)
 
 # For local development
 if __name__ == "__main__":
@@ -1,3 +1,4 @@
+from .metrics import router as metrics_router
 from .search import router as search_router
 
-__all__ = ['search_router']
+__all__ = ['metrics_router', 'search_router']
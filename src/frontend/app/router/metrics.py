@@ -0,0 +1,13 @@
+from fastapi import APIRouter
+from fastapi.responses import Response
+
+# first-party
+from src.utils import metrics
+
+router = APIRouter(tags=["metrics"])
+
+
+@router.get("/metrics")
+async def get_metrics():
+    body, content_type = metrics.render()
+    return Response(content=body, media_type=content_type)
@@ -2,11 +2,14 @@ import asyncio
 import json
 from fastapi import APIRouter, HTTPException
 from fastapi.responses import StreamingResponse
-from pydantic import BaseModel
-from typing import Optional
+from pydantic import BaseModel, Field
+from typing import List, Optional
 
 # first-party
-from src.core import search, models
+from src.core import batch, conversation, search, models
+from src.utils import metrics
+from src.utils.cache import normalize_query
+from src.utils.singleflight import SingleFlight
 
 router = APIRouter(prefix="/api/v1", tags=["search"])
 
@@ -21,9 +24,20 @@ MODEL_MAPPING = {
     "gpt4": models.Models.GPT_4O
 }
 
+# identical searches in flight share one pipeline, keyed on (normalized query, options, sections)
+_search_flights = SingleFlight()
+
 class SearchRequest(BaseModel):
     query: str
     model: Optional[str] = "flash"  # default to flash model
+    query_model: Optional[str] = None  # model writing the search queries, defaults to `model`
+    prune_model: Optional[str] = None  # model judging search results, defaults to `model`
+    cascade: bool = False  # redo query/prune calls with `model` when the smaller model's output is unusable
+    fetch_pages: bool = False  # ground the answer in the full text of the kept pages
+    compact: bool = False  # typed query/prune results and no reasoning sections, fewer output tokens
+    latency_slo: Optional[float] = Field(None, gt=0)  # seconds to start answering; slow stages are cut short to meet it
+    sections: bool = False  # also stream the model's reasoning sections, as named SSE events
+    conversation_id: Optional[str] = None  # answer as a follow-up in this conversation, see POST /conversations
     test: bool = False
 
     class Config:
@@ -34,6 +48,22 @@ class SearchRequest(BaseModel):
             }
         }
 
+class BatchSearchRequest(BaseModel):
+    queries: List[str]
+    model: Optional[str] = "flash"
+    max_concurrency: Optional[int] = Field(None, gt=0)  # questions answered at once, None for the server default
+
+    class Config:
+        schema_extra = {
+            "example": {
+                "queries": ["What is Python?", "What is Rust?"],
+                "model": "flash"
+            }
+        }
+
+class ConversationRequest(BaseModel):
+    model: Optional[str] = "flash"  # model summarizing older turns
+
 class SearchResponse(BaseModel):
     result: str
     model_used: str
@@ -57,32 +87,106 @@ async def mock_streaming():
     yield f'data: [DONE]'
 
 
+def get_model(model_key: str):
+    # Map model string to actual model
+    model_key = model_key.lower()
+    if model_key not in MODEL_MAPPING:
+        raise HTTPException(
+            status_code=400, 
+            detail=f"Invalid model. Available models: {', '.join(MODEL_MAPPING.keys())}"
+        )
+    return MODEL_MAPPING[model_key]
+
+
 @router.post("/search")
 async def perform_search(request: SearchRequest):
     try:
         if request.test: return StreamingResponse(mock_streaming(), media_type="text/event-stream")
-        # Map model string to actual model
-        model_key = request.model.lower()
-        if model_key not in MODEL_MAPPING:
-            raise HTTPException(
-                status_code=400, 
-                detail=f"Invalid model. Available models: {', '.join(MODEL_MAPPING.keys())}"
-            )
-            
-        model = MODEL_MAPPING[model_key]
-
-        # Initialize search session
-        ss = search.SearchSession(model=model)
-        
+        model = get_model(request.model)
+        options = dict(
+            query_model=get_model(request.query_model) if request.query_model else None,
+            prune_model=get_model(request.prune_model) if request.prune_model else None,
+            cascade=request.cascade,
+            fetch_pages=request.fetch_pages,
+            compact=request.compact,
+            deadline=request.latency_slo,
+        )
+        conv = None
+        if request.conversation_id:
+            conv = conversation.get_conversation_store().get(request.conversation_id)
+            if conv is None: raise HTTPException(status_code=404, detail="Conversation not found or expired")
+
         # Perform search
-        coros = ss.ask_stream(request.query)
         async def generate_stream():
+            if conv is not None: ss = conversation.FollowUpSearchSession(conv, model=model, **options)
+            else: ss = search.SearchSession(model=model, answer_cache=search.get_answer_cache(), **options)
             to_dict = lambda x: dict(choices=[{'delta': {'role': 'assistant', 'content': x}}])
-            async for chunk in coros:
-                yield f'data: {json.dumps(to_dict(chunk))}\n\n'
+            # tells the client, ahead of the answer, which stages the deadline cut short
+            degraded = lambda: f'event: degraded\ndata: {json.dumps(dict(stages=ss.degraded))}\n\n'
+            announced = False
+            if not request.sections:
+                async for chunk in ss.ask_stream(request.query):
+                    if ss.degraded and not announced:
+                        announced = True
+                        yield degraded()
+                    yield f'data: {json.dumps(to_dict(chunk))}\n\n'
+            else:
+                # final answer goes out as regular chunks, every other section as its own event type
+                async for section, text in ss.ask_stream_sections(request.query):
+                    if ss.degraded and not announced:
+                        announced = True
+                        yield degraded()
+                    if section == 'final_answer': yield f'data: {json.dumps(to_dict(text))}\n\n'
+                    elif section is not None: yield f'event: {section}\ndata: {json.dumps(dict(content=text))}\n\n'
+            if ss.degraded and not announced: yield degraded()
             yield 'data: [DONE]'
 
-        return StreamingResponse(generate_stream(), media_type="text/event-stream")
+        if conv is not None:
+            # follow-ups depend on the conversation so far, they're answered one at a time and never shared
+            async def generate_turn():
+                async with conv.lock:
+                    async for chunk in generate_stream(): yield chunk
+            return StreamingResponse(generate_turn(), media_type="text/event-stream")
+
+        # clients asking the same question while it's being answered join the running stream
+        key = (normalize_query(request.query), model, *options.values(), request.sections)
+        if key in _search_flights: metrics.SEARCH_COALESCED.inc()
+        stream = _search_flights.stream(key, generate_stream)
+
+        return StreamingResponse(stream, media_type="text/event-stream")
+    except HTTPException:
+        raise
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=str(e))
+
+
+@router.post("/conversations")
+async def create_conversation(request: ConversationRequest = ConversationRequest()):
+    """Starts a conversation; pass its id as `conversation_id` to /search to ask follow-up questions."""
+    conv = conversation.get_conversation_store().create(model=get_model(request.model))
+    return {"conversation_id": conv.id}
+
+
+@router.delete("/conversations/{conversation_id}")
+async def delete_conversation(conversation_id: str):
+    if not conversation.get_conversation_store().delete(conversation_id):
+        raise HTTPException(status_code=404, detail="Conversation not found or expired")
+    return {"deleted": conversation_id}
+
+
+@router.post("/search/batch")
+async def perform_batch_search(request: BatchSearchRequest):
+    """Answers many questions, streaming one JSON object per line as each one finishes."""
+    try:
+        model = get_model(request.model)
+        if not request.queries: raise HTTPException(status_code=400, detail="No queries given")
+
+        async def generate_lines():
+            async for result in batch.run_batch(request.queries, model=model, max_questions=request.max_concurrency,
+                                                answer_cache=search.get_answer_cache()):
+                yield json.dumps(result) + '\n'
+
+        return StreamingResponse(generate_lines(), media_type="application/x-ndjson")
     except HTTPException:
         raise
     except Exception as e:
@@ -3,36 +3,109 @@
 # ===
 import os
 import base64
+import random
+import threading
+from collections import OrderedDict
 
 from src import config
 
+
 def setup_logging():
+    if not config.settings.TELEMETRY_ENABLED:
+        print('logging disabled')
+        return
+
     try:
         # Langfuse credentials
         LANGFUSE_AUTH = base64.b64encode(f"{config.settings.LANGFUSE_PUBLIC_KEY}:{config.settings.LANGFUSE_SECRET_KEY}".encode()).decode()
 
         # OpenTelemetry endpoints
-        os.environ["OTEL_EXPORTER_OTLP_ENDPOINT"] = "http://localhost:3000/api/public/otel"
+        os.environ["OTEL_EXPORTER_OTLP_ENDPOINT"] = config.settings.OTEL_EXPORTER_OTLP_ENDPOINT
         os.environ["OTEL_EXPORTER_OTLP_HEADERS"] = f"Authorization=Basic {LANGFUSE_AUTH}"
 
         from opentelemetry.sdk.trace import TracerProvider
+        from opentelemetry.sdk.trace.sampling import ParentBased, TraceIdRatioBased
         from opentelemetry.exporter.otlp.proto.http.trace_exporter import OTLPSpanExporter
-        from opentelemetry.sdk.trace.export import SimpleSpanProcessor
+        from opentelemetry.sdk.trace.export import BatchSpanProcessor
 
-        trace_provider = TracerProvider()
-        trace_provider.add_span_processor(SimpleSpanProcessor(OTLPSpanExporter()))
+        # spans are exported from a background thread; once the queue is full new spans are dropped
+        span_processor = BatchSpanProcessor(
+            OTLPSpanExporter(),
+            max_queue_size=config.settings.TRACE_MAX_QUEUE_SIZE,
+            max_export_batch_size=config.settings.TRACE_MAX_EXPORT_BATCH_SIZE,
+            schedule_delay_millis=config.settings.TRACE_SCHEDULE_DELAY_MS,
+            export_timeout_millis=config.settings.TRACE_EXPORT_TIMEOUT_MS,
+        )
+        if config.settings.TRACE_TAIL_SAMPLE_RATIO < 1.0:
+            span_processor = TailSamplingSpanProcessor(
+                span_processor,
+                ratio=config.settings.TRACE_TAIL_SAMPLE_RATIO,
+                latency_threshold=config.settings.TRACE_TAIL_LATENCY_THRESHOLD,
+            )
+
+        sampler = ParentBased(TraceIdRatioBased(config.settings.TRACE_SAMPLE_RATIO))
+        trace_provider = TracerProvider(sampler=sampler)
 
         # Sets the global default tracer provider
         from opentelemetry import trace
         trace.set_tracer_provider(trace_provider)
 
-        # OpenLLMetry
+        # OpenLLMetry, reuses the provider above and registers our processor on it
         from traceloop.sdk import Traceloop
-        Traceloop.init(disable_batch=False,
-                       api_endpoint=os.environ.get("OTEL_EXPORTER_OTLP_ENDPOINT"),
-                       headers=os.environ.get(f"Authorization=Basic {LANGFUSE_AUTH}"),)
+        Traceloop.init(processor=span_processor,
+                       api_endpoint=config.settings.OTEL_EXPORTER_OTLP_ENDPOINT,
+                       headers={"Authorization": f"Basic {LANGFUSE_AUTH}"},)
 
         print('logging initialized')
     except Exception as e:
         print(e)
         print('Couldn\'t start logging')
+
+
+# duck-typed SpanProcessor, so importing this module doesn't pull in opentelemetry
+class TailSamplingSpanProcessor:
+    """
+    Buffers the spans of each trace until its local root span ends, then forwards the
+    whole trace to the delegate if it errored, was slower than latency_threshold
+    seconds, or falls within ratio. Otherwise the trace is dropped.
+
+    At most max_pending_traces unfinished traces are buffered; the oldest is dropped
+    beyond that.
+    """
+
+    def __init__(self, delegate, ratio: float, latency_threshold: float, max_pending_traces: int = 1000):
+        self.delegate = delegate
+        self.ratio = ratio
+        self.latency_threshold = latency_threshold
+        self.max_pending_traces = max_pending_traces
+        self._pending = OrderedDict()
+        self._lock = threading.Lock()
+
+    def on_start(self, span, parent_context=None):
+        self.delegate.on_start(span, parent_context=parent_context)
+
+    def on_end(self, span):
+        trace_id = span.context.trace_id
+        is_root = span.parent is None or span.parent.is_remote
+        with self._lock:
+            spans = self._pending.setdefault(trace_id, [])
+            spans.append(span)
+            if not is_root:
+                while len(self._pending) > self.max_pending_traces: self._pending.popitem(last=False)
+                return
+            del self._pending[trace_id]
+
+        if self._keep(span, spans):
+            for x in spans: self.delegate.on_end(x)
+
+    def _keep(self, root, spans) -> bool:
+        from opentelemetry.trace import StatusCode
+        if any(x.status.status_code == StatusCode.ERROR for x in spans): return True
+        if (root.end_time - root.start_time) / 1e9 >= self.latency_threshold: return True
+        return random.random() < self.ratio
+
+    def shutdown(self):
+        self.delegate.shutdown()
+
+    def force_flush(self, timeout_millis: int = 30000) -> bool:
+        return self.delegate.force_flush(timeout_millis)
@@ -0,0 +1,161 @@
+import aiohttp
+import asyncio
+import codecs
+import weakref
+
+from loguru import logger
+from typing import Optional
+from urllib.parse import urlsplit
+
+from src import config
+from src.utils import http, metrics
+from src.utils.cache import PageCache
+from src.utils.extract import TextExtractor, extract_plain_text
+
+HEADERS = {
+  'User-Agent': 'Mozilla/5.0 (compatible; pro-search/1.0)',
+  'Accept': 'text/html,application/xhtml+xml,text/plain;q=0.9',
+}
+CHUNK_SIZE = 16 * 1024
+
+
+_page_cache: Optional[PageCache] = None
+
+def get_page_cache() -> Optional[PageCache]:
+  """
+  Returns the process-wide page cache, creating it on first use.
+
+  :return: The shared PageCache, or None if caching is disabled in settings.
+  """
+  global _page_cache
+  if not config.settings.PAGE_CACHE_ENABLED: return None
+  if _page_cache is None:
+    _page_cache = PageCache(
+      path=config.settings.PAGE_CACHE_PATH,
+      ttl=config.settings.PAGE_CACHE_TTL,
+      max_entries=config.settings.PAGE_CACHE_MAX_ENTRIES,
+    )
+  return _page_cache
+
+
+# one semaphore per host while any fetch for it is in flight
+_host_slots = weakref.WeakValueDictionary()
+_fetch_slots = None
+
+def _get_host_slots(host: str) -> asyncio.Semaphore:
+  slots = _host_slots.get(host)
+  if slots is None: slots = _host_slots[host] = asyncio.Semaphore(config.settings.PAGE_FETCH_PER_HOST)
+  return slots
+
+def _get_fetch_slots() -> asyncio.Semaphore:
+  global _fetch_slots
+  if _fetch_slots is None: _fetch_slots = asyncio.Semaphore(config.settings.PAGE_FETCH_CONCURRENCY)
+  return _fetch_slots
+
+
+async def fetch_page(url: str, use_cache: bool = True) -> Optional[str]:
+  """
+  Downloads a web page and extracts its main text while it streams in.
+
+  The download stops at PAGE_FETCH_MAX_BYTES, or once PAGE_FETCH_MAX_CHARS of text
+  were extracted. Cached pages are served without a request while fresh, and
+  revalidated with their ETag once stale.
+
+  :param url: The page URL.
+  :param use_cache: Whether to serve from and populate the shared page cache.
+  :return: The extracted text, or None if the page couldn't be fetched or isn't text.
+  """
+  cache = get_page_cache() if use_cache else None
+  cached = cache.get(url) if cache is not None else None
+  if cached is not None and cached[2]:
+    metrics.PAGE_FETCHES.labels('cached').inc()
+    return cached[0]
+
+  headers = dict(HEADERS)
+  if cached is not None and cached[1]: headers['If-None-Match'] = cached[1]
+  timeout = aiohttp.ClientTimeout(
+    total=config.settings.PAGE_FETCH_TIMEOUT,
+    sock_connect=min(config.settings.HTTP_CONNECT_TIMEOUT, config.settings.PAGE_FETCH_TIMEOUT),
+  )
+
+  host = urlsplit(url).hostname or ''
+  try:
+    # host slot first, so a busy host doesn't tie up global slots other hosts could use
+    async with _get_host_slots(host), _get_fetch_slots():
+      async with http.get_session().get(url, headers=headers, timeout=timeout) as response:
+        if response.status == 304 and cached is not None:
+          cache.revalidated(url)
+          metrics.PAGE_FETCHES.labels('not_modified').inc()
+          return cached[0]
+        response.raise_for_status()
+
+        content_type = response.content_type or ''
+        if content_type not in ('text/html', 'application/xhtml+xml', 'text/plain'):
+          metrics.PAGE_FETCHES.labels('skipped').inc()
+          return None
+        text = await _read_text(response, content_type)
+        etag = response.headers.get('ETag')
+  except asyncio.TimeoutError:
+    logger.debug(f'Page fetch timed out: {url}')
+    metrics.PAGE_FETCHES.labels('timeout').inc()
+    return None
+  except (aiohttp.ClientError, ValueError) as e:
+    logger.debug(f'Page fetch failed: {url}: {e}')
+    metrics.PAGE_FETCHES.labels('error').inc()
+    return None
+
+  metrics.PAGE_FETCHES.labels('ok').inc()
+  if cache is not None and text: cache.set(url, text, etag)
+  return text
+
+
+async def _read_text(response: aiohttp.ClientResponse, content_type: str) -> str:
+  max_bytes = config.settings.PAGE_FETCH_MAX_BYTES
+  max_chars = config.settings.PAGE_FETCH_MAX_CHARS
+  try:
+    decoder = codecs.getincrementaldecoder(response.charset or 'utf-8')(errors='replace')
+  except LookupError:
+    decoder = codecs.getincrementaldecoder('utf-8')(errors='replace')
+
+  extractor = TextExtractor(max_chars=max_chars) if content_type != 'text/plain' else None
+  plain = []
+  received = 0
+  async for chunk in response.content.iter_chunked(CHUNK_SIZE):
+    chunk = chunk[:max_bytes - received]
+    received += len(chunk)
+    text = decoder.decode(chunk)
+    if extractor is not None:
+      # html parsing is pure python, keep it off the event loop
+      await asyncio.to_thread(extractor.feed, text)
+      if extractor.full: break
+    else:
+      plain.append(text)
+    if received >= max_bytes: break
+
+  if extractor is None: return extract_plain_text(''.join(plain) + decoder.decode(b'', final=True), max_chars=max_chars)
+  extractor.feed(decoder.decode(b'', final=True))
+  extractor.close()
+  return extractor.text
+
+
+async def fetch_pages(urls: list[str], timeout: Optional[float] = None, use_cache: bool = True) -> dict[str, str]:
+  """
+  Fetches pages concurrently, within the global and per-host fetch limits.
+
+  :param urls: The page URLs.
+  :param timeout: Seconds for the whole batch, at most PAGE_FETCH_STAGE_TIMEOUT. Pages
+    still loading by then are cancelled and left out.
+  :param use_cache: Whether to use the shared page cache.
+  :return: Mapping of URL to extracted text, for the pages that yielded any.
+  """
+  urls = list(dict.fromkeys(urls))
+  if not urls: return {}
+  tasks = {asyncio.create_task(fetch_page(url, use_cache=use_cache)): url for url in urls}
+  if timeout is None: timeout = config.settings.PAGE_FETCH_STAGE_TIMEOUT
+  done, pending = await asyncio.wait(tasks, timeout=min(timeout, config.settings.PAGE_FETCH_STAGE_TIMEOUT))
+  if pending:
+    for t in pending: t.cancel()
+    await asyncio.gather(*pending, return_exceptions=True)
+    logger.info(f'Skipped {len(pending)}/{len(urls)} pages still loading at the deadline')
+    metrics.PAGE_FETCHES.labels('timeout').inc(len(pending))
+  return {tasks[t]: t.result() for t in done if t.exception() is None and t.result()}
@@ -1,11 +1,16 @@
 import aiohttp
 import asyncio
 import os
+import time
 
-from dataclasses import dataclass
+from collections import deque
+from dataclasses import asdict, dataclass
 from loguru import logger
+from typing import Optional
 
 from src import config
+from src.utils import http, metrics, rate_limiter
+from src.utils.cache import SearchCache, SearchIndex
 
 @dataclass
 class SearchResult:
@@ -16,11 +21,13 @@ class SearchResult:
   :param url: The URL of the search result.
   :param description: A brief description of the search result.
   :param extra_snippets: Additional snippets related to the search result.
+  :param page_text: Main text of the page, if it was fetched.
   """
   title: str
   url: str
   description: str
   extra_snippets: list
+  page_text: str = ''
 
   def __str__(self) -> str:
     """
@@ -36,63 +43,364 @@ class SearchResult:
     )
 
 
-async def search_brave(query: str, count: int = 5, rate_limiter = None) -> list[SearchResult]:
+_search_cache: Optional[SearchCache] = None
+
+def get_search_cache() -> Optional[SearchCache]:
   """
-  Searches the web using Brave Search API and returns structured search results.
+  Returns the process-wide search cache, creating it on first use.
 
-  :param query: The search query string.
-  :param count: The number of search results to return.
-  :return: A list of SearchResult objects containing the search results.
+  :return: The shared SearchCache, or None if caching is disabled in settings.
   """
-  if not query:
-    return []
+  global _search_cache
+  if not config.settings.SEARCH_CACHE_ENABLED: return None
+  if _search_cache is None:
+    _search_cache = SearchCache(
+      path=config.settings.SEARCH_CACHE_PATH,
+      ttl=config.settings.SEARCH_CACHE_TTL,
+      max_entries=config.settings.SEARCH_CACHE_MAX_ENTRIES,
+    )
+  return _search_cache
 
-  url: str = "https://api.search.brave.com/res/v1/web/search"
-  headers: dict = {
-      "Accept": "application/json",
-      "X-Subscription-Token": config.settings.BRAVE_SEARCH_AI_API_KEY
-  }
-  if not headers['X-Subscription-Token']:
-    logger.error("Error: Missing Brave Search API key.")
-    return []
 
-  params: dict = {
-      "q": query,
-      "count": count
-  }
+_search_index: Optional[SearchIndex] = None
+
+def get_search_index() -> SearchIndex:
+  """
+  Returns the process-wide full-text index of search results seen so far, creating it on first use.
+
+  :return: The shared SearchIndex.
+  """
+  global _search_index
+  if _search_index is None:
+    _search_index = SearchIndex(path=config.settings.SEARCH_INDEX_PATH, max_entries=config.settings.SEARCH_INDEX_MAX_ENTRIES)
+  return _search_index
+
+
+def get_brave_rate_limiter():
+  """
+  Returns the rate limiter guarding the configured Brave API key.
+
+  :return: The limiter shared by every search using that key.
+  """
+  return rate_limiter.get_rate_limiter(
+    config.settings.BRAVE_SEARCH_AI_API_KEY,
+    rate=config.settings.BRAVE_RATE_LIMIT,
+    capacity=config.settings.BRAVE_RATE_CAPACITY,
+    shared_dir=config.settings.RATE_LIMIT_SHARED_DIR,
+  )
+
 
-  retries: int = 0
-  max_retries: int = 3
-  backoff_factor: int = 2
+class SearchProviderError(Exception):
+  """
+  A search provider failed to answer: rate limited, server error, timeout or a connection problem.
+
+  :param provider: Name of the provider.
+  :param status: HTTP status of the failed response, None if there was none.
+  :param retriable: Whether trying again later may succeed, e.g. after rate limiting or a server error.
+  """
 
-  async with aiohttp.ClientSession() as session:
-    while retries < max_retries:
+  def __init__(self, provider: str, status: Optional[int] = None, message: str = '', retriable: bool = False):
+    super().__init__(f'{provider} search failed' + (f' with status {status}' if status else '') + (f': {message}' if message else ''))
+    self.provider = provider
+    self.status = status
+    self.retriable = retriable
+
+
+class SearchProvider:
+  """
+  A search backend. Subclasses implement `search` and report each request's latency
+  with `observe`; the recent latencies decide when a SearchRouter hedges the provider.
+  """
+  name = 'provider'
+  cacheable = True # whether its results may go into the search cache
+
+  def __init__(self):
+    self.latencies = deque(maxlen=config.settings.SEARCH_LATENCY_WINDOW)
+
+  async def search(self, query: str, count: int, rate_limiter=None, on_request=None, retry=True) -> list[SearchResult]:
+    """
+    :param query: The search query string.
+    :param count: The number of search results to return.
+    :param rate_limiter: Limiter to acquire before each request to a rate-limited backend.
+    :param on_request: Called without arguments when a request is sent, after any rate limiter wait.
+    :param retry: False makes a single attempt, for when another provider can stand in.
+    :return: The results, empty if nothing matched.
+    :raises SearchProviderError: If the backend failed to answer.
+    """
+    raise NotImplementedError
+
+  def remember(self, query: str, results: list[SearchResult]):
+    """Sees the results another provider answered a query with."""
+
+  def observe(self, seconds: float, outcome: str = 'ok'):
+    self.latencies.append(seconds)
+    metrics.SEARCH_PROVIDER_LATENCY.labels(self.name, outcome).observe(seconds)
+
+  def latency_percentile(self, q: float) -> Optional[float]:
+    """Returns the q-th percentile of the recent latencies, None until there are enough samples."""
+    if len(self.latencies) < config.settings.SEARCH_HEDGE_MIN_SAMPLES: return None
+    latencies = sorted(self.latencies)
+    return latencies[min(len(latencies) - 1, int(q / 100 * len(latencies)))]
+
+  def hedge_delay(self) -> float:
+    """Seconds to wait on this provider before racing the next one."""
+    delay = self.latency_percentile(config.settings.SEARCH_HEDGE_PERCENTILE)
+    return delay if delay is not None else config.settings.SEARCH_HEDGE_DELAY
+
+
+class BraveProvider(SearchProvider):
+  """
+  Web search with the Brave Search API.
+
+  :param max_retries: Attempts per search made with retry, BRAVE_MAX_RETRIES by default. Rate
+    limiting, server errors and timeouts are retried with exponential backoff; other errors aren't.
+  """
+  name = 'brave'
+
+  def __init__(self, max_retries: Optional[int] = None):
+    super().__init__()
+    self.max_retries = max_retries or config.settings.BRAVE_MAX_RETRIES
+
+  async def search(self, query: str, count: int, rate_limiter=None, on_request=None, retry=True) -> list[SearchResult]:
+    url: str = config.settings.BRAVE_SEARCH_URL
+    headers: dict = {
+        "Accept": "application/json",
+        "X-Subscription-Token": config.settings.BRAVE_SEARCH_AI_API_KEY
+    }
+    if not headers['X-Subscription-Token']:
+      logger.error("Error: Missing Brave Search API key.")
+      raise SearchProviderError(self.name, message='missing API key')
+
+    params: dict = {
+        "q": query,
+        "count": count
+    }
+    backoff_factor: int = 2
+
+    session = http.get_session()
+    attempts = self.max_retries if retry else 1
+    for attempt in range(1, attempts + 1):
+      if rate_limiter is not None:
+        waited = time.perf_counter()
+        await rate_limiter.acquire(num_tokens=1)
+        metrics.RATE_LIMIT_WAIT.observe(time.perf_counter() - waited)
+      # rate limiter waits are ours, not brave's, so they're left out of its latency
+      if on_request is not None: on_request()
+      started = time.perf_counter()
       try:
-        if rate_limiter is not None: await rate_limiter.acquire(num_tokens=1)
         async with session.get(url, headers=headers, params=params) as response:
+          metrics.BRAVE_LATENCY.labels(response.status).observe(time.perf_counter() - started)
           response.raise_for_status()
           results_json = await response.json()
-          logger.debug('Got results')
-          break
-      except aiohttp.ClientError as e:
-        logger.exception(f"HTTP Request failed: {e}, retrying...")
-
-      finally:
-        retries += 1
-        if retries < max_retries:
-          await asyncio.sleep(backoff_factor ** retries)
-        else:
-          return []
-
-
-  results: list[SearchResult] = []
-  for item in results_json.get('web', {}).get('results', []):
-    result = SearchResult(
-        title=item.get('title', ''),
-        url=item.get('url', ''),
-        description=item.get('description', ''),
-        extra_snippets=item.get('extra_snippets', []),
-    )
-    results.append(result)
+        self.observe(time.perf_counter() - started)
+        logger.debug('Got results')
+        break
+      except asyncio.CancelledError:
+        # lost a hedge race; still a lower bound of how slow it was
+        self.observe(time.perf_counter() - started, 'cancelled')
+        raise
+      except (aiohttp.ClientError, asyncio.TimeoutError) as e:
+        self.observe(time.perf_counter() - started, 'error')
+        status = getattr(e, 'status', None)
+        retriable = status is None or status == 429 or status >= 500
+        # back off only between attempts, never after the last one
+        if attempt == attempts or not retriable:
+          logger.warning(f"HTTP Request failed: {e!r}, giving up")
+          raise SearchProviderError(self.name, status, repr(e), retriable=retriable) from e
+        logger.warning(f"HTTP Request failed: {e!r}, retrying...")
+        metrics.BRAVE_RETRIES.inc()
+        await asyncio.sleep(backoff_factor ** attempt)
+
+    results: list[SearchResult] = []
+    for item in results_json.get('web', {}).get('results', []):
+      result = SearchResult(
+          title=item.get('title', ''),
+          url=item.get('url', ''),
+          description=item.get('description', ''),
+          extra_snippets=item.get('extra_snippets', []),
+      )
+      results.append(result)
+    return results
+
+
+class LocalIndexProvider(SearchProvider):
+  """
+  Full-text search over the results other providers returned before. Much faster than
+  web search but only as fresh and complete as what was indexed, so its results aren't
+  cached.
+
+  :param index: The index to search and add results to.
+  """
+  name = 'local'
+  cacheable = False
+
+  def __init__(self, index: SearchIndex):
+    super().__init__()
+    self.index = index
+
+  async def search(self, query: str, count: int, rate_limiter=None, on_request=None, retry=True) -> list[SearchResult]:
+    if on_request is not None: on_request()
+    started = time.perf_counter()
+    try:
+      results = [SearchResult(**x) for x in self.index.search(query, count)]
+    except Exception as e:
+      self.observe(time.perf_counter() - started, 'error')
+      raise SearchProviderError(self.name, message=repr(e)) from e
+    self.observe(time.perf_counter() - started)
+    return results
+
+  def remember(self, query: str, results: list[SearchResult]):
+    self.index.add([asdict(x) for x in results])
+
+
+class SearchRouter:
+  """
+  Searches with a list of providers in order of preference.
+
+  A provider that fails with a SearchProviderError fails over to the next one right
+  away. While another provider can stand in, a provider gets a single attempt; after a
+  retriable failure (rate limiting, server errors) it's tried again with its retries
+  only if the providers after it came up empty. With hedging, a provider still running past its hedge delay (a percentile of
+  its recent latencies) is raced against the next one, and the first non-empty results
+  win. The hedge delay counts from when the request was sent, so waiting on our own
+  rate limiter never triggers a hedge. Results of cacheable providers are shown to every provider, so the local index
+  learns from web searches.
+
+  :param providers: The providers, most preferred first.
+  :param hedge: Whether to race slow providers against the next one.
+  """
+
+  def __init__(self, providers: list[SearchProvider], hedge: bool = False):
+    self.providers = providers
+    self.hedge = hedge
+
+  async def search(self, query: str, count: int, rate_limiter=None) -> tuple[list[SearchResult], Optional[SearchProvider]]:
+    """
+    :return: The results and the provider they came from, or ([], None) if every provider failed.
+    """
+    queue = [(p, False) for p in self.providers] # (provider, whether it failed before and is being retried)
+    running = {} # task -> [provider, time its request was sent (None while it waits to send), whether it retries]
+    sent = asyncio.Event() # a running provider sent its request, so its hedge clock started
+    answer = ([], None) # empty results, kept in case nothing better arrives
+
+    def launch():
+      provider, retrying = queue.pop(0)
+      # retrying inside the provider (with backoff) only when nothing else can answer instead
+      retry = retrying or not queue
+      entry = [provider, None, retry]
+      def on_request():
+        if entry[1] is None:
+          entry[1] = time.perf_counter()
+          sent.set()
+      running[asyncio.create_task(provider.search(query, count, rate_limiter=rate_limiter, on_request=on_request, retry=retry))] = entry
+
+    launch()
+    try:
+      while running:
+        timeout = None
+        if self.hedge and queue:
+          now = time.perf_counter()
+          deadlines = [started + p.hedge_delay() for p, started, _ in running.values() if started is not None]
+          if deadlines: timeout = max(0.0, min(deadlines) - now)
+        sent.clear()
+        waiting_to_send = asyncio.create_task(sent.wait())
+        done, _ = await asyncio.wait([*running, waiting_to_send], timeout=timeout, return_when=asyncio.FIRST_COMPLETED)
+        waiting_to_send.cancel()
+        done.discard(waiting_to_send)
+        if not done:
+          # either a provider just sent its request (recompute the deadline) or one is past it
+          if sent.is_set(): continue
+          metrics.SEARCH_HEDGES.labels(queue[0][0].name).inc()
+          launch()
+          continue
+
+        for task in done:
+          provider, _, retried = running.pop(task)
+          try:
+            results = task.result()
+          except SearchProviderError as e:
+            logger.warning(f'{e}, failing over' if queue else str(e))
+            metrics.SEARCH_FAILOVERS.labels(provider.name, str(e.status or 'none')).inc()
+            # back to it, retries and all, if the providers after it have nothing
+            if e.retriable and not retried: queue.append((provider, True))
+            continue
+          if results:
+            metrics.SEARCH_PROVIDER_ANSWERS.labels(provider.name).inc()
+            if provider.cacheable:
+              for p in self.providers:
+                if p is not provider: p.remember(query, results)
+            return results, provider
+          if answer[1] is None: answer = (results, provider)
+        # nothing usable yet and nothing left in flight: on to the next provider
+        if not running and queue: launch()
+      return answer
+    finally:
+      for task in running: task.cancel()
+
+
+def make_provider(name: str) -> SearchProvider:
+  """
+  :param name: Provider name, 'brave' or 'local'.
+  """
+  if name == 'brave': return BraveProvider()
+  if name == 'local': return LocalIndexProvider(get_search_index())
+  raise ValueError(f'Unknown search provider: {name}')
+
+
+_search_router: Optional[SearchRouter] = None
+
+def get_search_router() -> SearchRouter:
+  """
+  Returns the process-wide search router over the SEARCH_PROVIDERS, creating it on first use.
+
+  :return: The shared SearchRouter.
+  """
+  global _search_router
+  if _search_router is None:
+    names = [x.strip() for x in config.settings.SEARCH_PROVIDERS.split(',') if x.strip()]
+    providers = [make_provider(x) for x in names]
+    _search_router = SearchRouter(providers, hedge=config.settings.SEARCH_HEDGE_ENABLED)
+  return _search_router
+
+
+async def search_web(query: str, count: int = 10, rate_limiter = None, use_cache: bool = True,
+                     router: Optional[SearchRouter] = None) -> list[SearchResult]:
+  """
+  Searches with the configured providers and returns structured search results.
+
+  :param query: The search query string.
+  :param count: The number of search results to return.
+  :param rate_limiter: Limiter for rate-limited providers, see get_brave_rate_limiter.
+  :param use_cache: Whether to serve from and populate the shared search cache.
+  :param router: Providers to search with, the shared router by default.
+  :return: A list of SearchResult objects, empty if nothing was found or every provider failed.
+  """
+  if not query:
+    return []
+
+  cache = get_search_cache() if use_cache else None
+  if cache is not None:
+    cached = cache.get(query, count)
+    if cached is not None:
+      logger.debug('Search cache hit')
+      return [SearchResult(**x) for x in cached]
+
+  results, provider = await (router or get_search_router()).search(query, count, rate_limiter=rate_limiter)
+  if cache is not None and results and provider.cacheable: cache.set(query, count, [asdict(x) for x in results])
   return results
 
+
+_brave_router: Optional[SearchRouter] = None
+
+async def search_brave(query: str, count: int = 5, rate_limiter = None, use_cache: bool = True) -> list[SearchResult]:
+  """
+  Searches the web using Brave Search API only, retrying failures, and returns structured search results.
+
+  :param query: The search query string.
+  :param count: The number of search results to return.
+  :param use_cache: Whether to serve from and populate the shared search cache.
+  :return: A list of SearchResult objects containing the search results.
+  """
+  global _brave_router
+  if _brave_router is None: _brave_router = SearchRouter([BraveProvider()])
+  return await search_web(query, count, rate_limiter=rate_limiter, use_cache=use_cache, router=_brave_router)
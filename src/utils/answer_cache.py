@@ -0,0 +1,95 @@
+import hashlib
+import re
+import time
+import numpy as np
+from collections import OrderedDict
+from typing import Optional
+
+from src.utils.cache import normalize_query
+
+
+def embed(text: str, dims: int = 512) -> np.ndarray:
+  """
+  Embeds text as an L2-normalized bag of hashed word unigrams and character trigrams.
+
+  Cheap and local; good enough to catch reworded versions of the same question.
+
+  :param text: Text to embed.
+  :param dims: Number of hash buckets.
+  :return: Unit vector of shape (dims,).
+  """
+  words = re.findall(r'\w+', normalize_query(text))
+  grams = words + [w[i:i+3] for w in (f'#{x}#' for x in words) for i in range(len(w) - 2)]
+  vector = np.zeros(dims)
+  for gram in grams:
+    h = int.from_bytes(hashlib.blake2b(gram.encode(), digest_size=8).digest(), 'big')
+    vector[h % dims] += 1.0 if h >> 63 else -1.0 # signed hashing keeps collisions unbiased
+  norm = np.linalg.norm(vector)
+  return vector / norm if norm else vector
+
+
+def exact_terms(text: str) -> frozenset:
+  """Terms a paraphrase must repeat exactly: anything with a digit, such as versions, years and quantities."""
+  return frozenset(x for x in re.findall(r'\w+', normalize_query(text)) if any(c.isdigit() for c in x))
+
+
+# in-memory, ttl-bound, lru-evicted
+class AnswerCache:
+  """
+  Caches final answers by question, matching exact normalized text first and, if
+  semantic, falling back to embedding similarity.
+
+  The embedding barely tells "python 3.11" from "python 3.12", so a paraphrase only
+  counts if it also has exactly the same numbers (see exact_terms).
+
+  :param ttl: Seconds an answer stays valid.
+  :param max_entries: Max answers kept; least recently used ones are evicted first.
+  :param threshold: Min cosine similarity for a paraphrase to count as a hit.
+  :param semantic: Whether paraphrases can hit at all, or only the exact normalized question.
+  """
+
+  def __init__(self, ttl: float, max_entries: int, threshold: float, semantic: bool = False):
+    self.ttl = ttl
+    self.max_entries = max_entries
+    self.threshold = threshold
+    self.semantic = semantic
+    self.entries = OrderedDict() # (namespace, normalized question) -> (created_at, vector, exact terms, answer)
+    self.hits = 0
+    self.misses = 0
+
+  def get(self, question: str, namespace: str = '') -> Optional[str]:
+    self._expire()
+    key = (namespace, normalize_query(question))
+    if key not in self.entries and not self.semantic:
+      key = None
+    elif key not in self.entries:
+      terms = exact_terms(question)
+      candidates = [k for k, v in self.entries.items() if k[0] == namespace and v[2] == terms]
+      if candidates:
+        vectors = np.stack([self.entries[k][1] for k in candidates])
+        scores = vectors @ embed(question)
+        best = int(np.argmax(scores))
+        key = candidates[best] if scores[best] >= self.threshold else None
+      else:
+        key = None
+
+    if key is None:
+      self.misses += 1
+      return None
+    self.entries.move_to_end(key)
+    self.hits += 1
+    return self.entries[key][3]
+
+  def put(self, question: str, answer: str, namespace: str = ''):
+    key = (namespace, normalize_query(question))
+    self.entries[key] = (time.time(), embed(question) if self.semantic else None, exact_terms(question), answer)
+    self.entries.move_to_end(key)
+    while len(self.entries) > self.max_entries: self.entries.popitem(last=False)
+
+  def _expire(self):
+    now = time.time()
+    for key in [k for k, v in self.entries.items() if now - v[0] > self.ttl]: del self.entries[key]
+
+  def stats(self) -> dict:
+    lookups = self.hits + self.misses
+    return dict(size=len(self.entries), hits=self.hits, misses=self.misses, hit_rate=self.hits / lookups if lookups else 0.0)
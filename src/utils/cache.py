@@ -0,0 +1,266 @@
+import json
+import re
+import sqlite3
+import threading
+import time
+from pathlib import Path
+from typing import Any, Optional
+
+
+def normalize_query(query: str) -> str:
+  """Lowercases the query and collapses whitespace so trivial variations share a cache entry."""
+  return re.sub(r'\s+', ' ', query).strip().lower()
+
+
+# connection, size cap and stats shared by the sqlite-backed stores below
+class SQLiteStore:
+  """
+  Base class of the persistent SQLite stores. Subclasses set `table`, `key_column`,
+  `order_column` and `schema`, and count `hits` and `misses` in their lookups.
+
+  :param path: Path of the SQLite database file. Use ':memory:' for a process-local store.
+  :param max_entries: Maximum number of rows kept in `table`.
+  """
+  table: str
+  key_column = 'key'
+  order_column = 'accessed_at' # oldest evicted first
+  schema: tuple = () # statements creating the tables and indexes
+
+  def __init__(self, path: str, max_entries: int):
+    self.path = path
+    self.max_entries = max_entries
+    self.hits = 0
+    self.misses = 0
+    self.evictions = 0
+
+    if path != ':memory:': Path(path).parent.mkdir(parents=True, exist_ok=True)
+    self._lock = threading.Lock()
+    self._conn = sqlite3.connect(path, check_same_thread=False, isolation_level=None)
+    self._conn.execute('PRAGMA journal_mode=WAL')
+    for statement in self.schema: self._conn.execute(statement)
+
+  def _size(self) -> int:
+    (size,) = self._conn.execute(f'SELECT COUNT(*) FROM {self.table}').fetchone()
+    return size
+
+  def _evict(self):
+    """Drops the rows over max_entries. Call with the lock held."""
+    overflow = self._size() - self.max_entries
+    if overflow <= 0: return
+    keys = self._conn.execute(
+      f'SELECT {self.key_column} FROM {self.table} ORDER BY {self.order_column} ASC LIMIT ?', (overflow,)
+    ).fetchall()
+    self._delete(keys)
+    self.evictions += overflow
+
+  def _delete(self, keys: list[tuple]):
+    self._conn.executemany(f'DELETE FROM {self.table} WHERE {self.key_column} = ?', keys)
+
+  def clear(self):
+    with self._lock: self._conn.execute(f'DELETE FROM {self.table}')
+
+  def stats(self) -> dict:
+    with self._lock: size = self._size()
+    lookups = self.hits + self.misses
+    return dict(
+      size=size,
+      hits=self.hits,
+      misses=self.misses,
+      evictions=self.evictions,
+      hit_rate=self.hits / lookups if lookups else 0.0,
+    )
+
+
+# ttl expiry on read, lru eviction
+class SearchCache(SQLiteStore):
+  """
+  Persistent cache for search results.
+
+  :param path: Path of the SQLite database file. Use ':memory:' for a process-local cache.
+  :param ttl: Seconds after which an entry is considered stale.
+  :param max_entries: Maximum number of entries kept; least recently used ones are evicted first.
+  """
+  table = 'search_cache'
+  schema = (
+    '''
+      CREATE TABLE IF NOT EXISTS search_cache (
+        key TEXT PRIMARY KEY,
+        value TEXT NOT NULL,
+        created_at REAL NOT NULL,
+        accessed_at REAL NOT NULL
+      )
+    ''',
+    'CREATE INDEX IF NOT EXISTS idx_search_cache_accessed_at ON search_cache (accessed_at)',
+  )
+
+  def __init__(self, path: str, ttl: float, max_entries: int):
+    super().__init__(path, max_entries)
+    self.ttl = ttl
+
+  @staticmethod
+  def make_key(query: str, count: int) -> str:
+    return f'{count}:{normalize_query(query)}'
+
+  def get(self, query: str, count: int) -> Optional[Any]:
+    key = self.make_key(query, count)
+    now = time.time()
+    with self._lock:
+      row = self._conn.execute('SELECT value, created_at FROM search_cache WHERE key = ?', (key,)).fetchone()
+      if row is None or now - row[1] > self.ttl:
+        if row is not None: self._conn.execute('DELETE FROM search_cache WHERE key = ?', (key,))
+        self.misses += 1
+        return None
+      self._conn.execute('UPDATE search_cache SET accessed_at = ? WHERE key = ?', (now, key))
+      self.hits += 1
+    return json.loads(row[0])
+
+  def set(self, query: str, count: int, value: Any):
+    key = self.make_key(query, count)
+    now = time.time()
+    with self._lock:
+      self._conn.execute(
+        'INSERT OR REPLACE INTO search_cache (key, value, created_at, accessed_at) VALUES (?, ?, ?, ?)',
+        (key, json.dumps(value), now, now)
+      )
+      self._evict()
+
+
+# lru eviction like SearchCache, but stale entries are kept for revalidation
+class PageCache(SQLiteStore):
+  """
+  Persistent cache of text extracted from web pages, keyed by URL along with the ETag it was served with.
+
+  :param path: Path of the SQLite database file. Use ':memory:' for a process-local cache.
+  :param ttl: Seconds after which a page should be revalidated (or refetched, without an ETag).
+  :param max_entries: Maximum number of pages kept; least recently used ones are evicted first.
+  """
+  table = 'page_cache'
+  key_column = 'url'
+  schema = (
+    '''
+      CREATE TABLE IF NOT EXISTS page_cache (
+        url TEXT PRIMARY KEY,
+        etag TEXT,
+        text TEXT NOT NULL,
+        fetched_at REAL NOT NULL,
+        accessed_at REAL NOT NULL
+      )
+    ''',
+    'CREATE INDEX IF NOT EXISTS idx_page_cache_accessed_at ON page_cache (accessed_at)',
+  )
+
+  def __init__(self, path: str, ttl: float, max_entries: int):
+    super().__init__(path, max_entries)
+    self.ttl = ttl
+
+  def get(self, url: str) -> Optional[tuple[str, Optional[str], bool]]:
+    """Returns (text, etag, fresh) for a cached page, stale or not, or None."""
+    now = time.time()
+    with self._lock:
+      row = self._conn.execute('SELECT text, etag, fetched_at FROM page_cache WHERE url = ?', (url,)).fetchone()
+      if row is None:
+        self.misses += 1
+        return None
+      self._conn.execute('UPDATE page_cache SET accessed_at = ? WHERE url = ?', (now, url))
+    fresh = now - row[2] <= self.ttl
+    if fresh: self.hits += 1
+    else: self.misses += 1
+    return row[0], row[1], fresh
+
+  def set(self, url: str, text: str, etag: Optional[str] = None):
+    now = time.time()
+    with self._lock:
+      self._conn.execute(
+        'INSERT OR REPLACE INTO page_cache (url, etag, text, fetched_at, accessed_at) VALUES (?, ?, ?, ?, ?)',
+        (url, etag, text, now, now)
+      )
+      self._evict()
+
+  def revalidated(self, url: str):
+    """Marks a cached page as fresh again, after the server answered 304 Not Modified."""
+    now = time.time()
+    with self._lock: self._conn.execute('UPDATE page_cache SET fetched_at = ?, accessed_at = ? WHERE url = ?', (now, now, url))
+
+
+# full-text index over search results seen before, the local stand-in for web search
+INDEX_STOPWORDS = frozenset(
+  'a an and are as at be but by compare compared does do for from how i in is it its of on or than that the '
+  'their there this to vs was what when where which who why will with'.split()
+)
+
+class SearchIndex(SQLiteStore):
+  """
+  Persistent SQLite FTS5 index of search results, keyed by URL and ranked with BM25.
+
+  :param path: Path of the SQLite database file. Use ':memory:' for a process-local index.
+  :param max_entries: Maximum number of results kept; the ones indexed longest ago are evicted first.
+  """
+  table = 'search_index_docs'
+  key_column = 'id'
+  order_column = 'indexed_at'
+  schema = (
+    '''
+      CREATE TABLE IF NOT EXISTS search_index_docs (
+        id INTEGER PRIMARY KEY,
+        url TEXT UNIQUE NOT NULL,
+        value TEXT NOT NULL,
+        indexed_at REAL NOT NULL
+      )
+    ''',
+    'CREATE INDEX IF NOT EXISTS idx_search_index_docs_indexed_at ON search_index_docs (indexed_at)',
+    'CREATE VIRTUAL TABLE IF NOT EXISTS search_index USING fts5(title, description, snippets)',
+  )
+
+  @staticmethod
+  def make_match(query: str) -> Optional[str]:
+    """Turns a free-text query into an FTS5 expression matching results containing all of its non-stopwords."""
+    words = list(dict.fromkeys(re.findall(r'\w+', query.lower())))
+    words = [x for x in words if x not in INDEX_STOPWORDS] or words
+    return ' AND '.join(f'"{x}"' for x in words) or None
+
+  def add(self, results: list[dict]):
+    """Indexes results given as dicts with title, url, description and extra_snippets, replacing older copies."""
+    now = time.time()
+    with self._lock:
+      self._conn.execute('BEGIN')
+      try:
+        for res in results:
+          if not res.get('url'): continue
+          row = self._conn.execute('SELECT id FROM search_index_docs WHERE url = ?', (res['url'],)).fetchone()
+          if row is not None: self._delete([row])
+          cur = self._conn.execute(
+            'INSERT INTO search_index_docs (url, value, indexed_at) VALUES (?, ?, ?)',
+            (res['url'], json.dumps(res), now)
+          )
+          self._conn.execute(
+            'INSERT INTO search_index (rowid, title, description, snippets) VALUES (?, ?, ?, ?)',
+            (cur.lastrowid, res.get('title', ''), res.get('description', ''), '\n'.join(res.get('extra_snippets', [])))
+          )
+        self._evict()
+        self._conn.execute('COMMIT')
+      except BaseException:
+        self._conn.execute('ROLLBACK')
+        raise
+
+  def search(self, query: str, count: int) -> list[dict]:
+    """Returns up to count indexed results matching the query, best first."""
+    match = self.make_match(query)
+    if match is None: return []
+    with self._lock:
+      rows = self._conn.execute(
+        'SELECT d.value FROM search_index JOIN search_index_docs d ON d.id = search_index.rowid '
+        'WHERE search_index MATCH ? ORDER BY bm25(search_index) LIMIT ?',
+        (match, count)
+      ).fetchall()
+    if rows: self.hits += 1
+    else: self.misses += 1
+    return [json.loads(x[0]) for x in rows]
+
+  def _delete(self, ids: list[tuple]):
+    self._conn.executemany('DELETE FROM search_index WHERE rowid = ?', ids)
+    super()._delete(ids)
+
+  def clear(self):
+    with self._lock:
+      self._conn.execute('DELETE FROM search_index')
+      self._conn.execute('DELETE FROM search_index_docs')
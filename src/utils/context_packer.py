@@ -0,0 +1,106 @@
+import dataclasses
+import re
+
+from src.utils import dedup, ranking
+
+RESULT_OVERHEAD_TOKENS = 20 # xml tags around every result
+SNIPPET_OVERHEAD_TOKENS = 4
+
+
+def estimate_tokens(text: str) -> int:
+  """Rough token count: ~4 characters per token for English text."""
+  return (len(text) + 3) // 4
+
+
+def truncate_to_tokens(text: str, max_tokens: int) -> str:
+  if estimate_tokens(text) <= max_tokens: return text
+  cut = text[:max_tokens * 4]
+  return cut[:cut.rfind(' ')].rstrip() + ' …' if ' ' in cut else cut
+
+
+def _headline_tokens(res, description: str) -> int:
+  return RESULT_OVERHEAD_TOKENS + estimate_tokens(res.title) + estimate_tokens(res.url) + estimate_tokens(description)
+
+
+def _normalize(text: str) -> str:
+  return ' '.join(re.findall(r'\w+', text.lower()))
+
+
+def pack_results(question: str, results: list, budget: int, max_description_tokens: int = 150) -> tuple[list, dict]:
+  """
+  Fits search results into a token budget for the answer prompt.
+
+  Results are ranked against the question and added best first with their title,
+  url and (truncated) description, so the context stays broad. Remaining budget is
+  then filled with the best-scoring extra snippets and fetched page paragraphs
+  across all results. Text that repeats a description or anything already packed
+  is dropped.
+
+  :param question: The user question, used for ranking.
+  :param results: Search results kept by pruning.
+  :param budget: Max estimated tokens for the whole context.
+  :param max_description_tokens: Descriptions longer than this are truncated.
+  :return: The packed results, best first, and packing stats.
+  """
+  documents = [' '.join([x.title, x.description, *x.extra_snippets, x.page_text]) for x in results]
+  order = [i for i, _ in ranking.shortlist(question, documents)]
+  paragraphs = [[y for y in x.page_text.split('\n') if y.strip()] for x in results]
+  tokens_before = sum(
+    _headline_tokens(x, x.description) + sum(SNIPPET_OVERHEAD_TOKENS + estimate_tokens(y) for y in x.extra_snippets)
+    + estimate_tokens(x.page_text) + (SNIPPET_OVERHEAD_TOKENS if x.page_text else 0)
+    for x in results
+  )
+
+  # pass 1: headline of every result that fits
+  used = 0
+  packed = {}
+  seen = []
+  for i in order:
+    res = results[i]
+    description = truncate_to_tokens(res.description, max_description_tokens)
+    cost = _headline_tokens(res, description)
+    if used + cost > budget: continue
+    used += cost
+    packed[i] = dataclasses.replace(res, description=description, extra_snippets=[], page_text='')
+    if len(description.split()) >= 8: seen.append(dedup.simhash(description))
+
+  # pass 2: best snippets and page paragraphs across the packed results
+  candidates = [(i, None, x) for i in packed for x in results[i].extra_snippets]
+  candidates += [(i, j, x) for i in packed for j, x in enumerate(paragraphs[i])]
+  scores = ranking.bm25_scores(question, [x for _, _, x in candidates]) if candidates else []
+  snippets_kept = 0
+  kept_paragraphs = {}
+  for k in sorted(range(len(candidates)), key=lambda k: -scores[k]):
+    i, j, snippet = candidates[k]
+    normalized = _normalize(snippet)
+    if not normalized or normalized in _normalize(packed[i].description): continue
+    if len(normalized.split()) >= 8:
+      fingerprint = dedup.simhash(snippet)
+      if any(dedup.hamming_distance(fingerprint, x) <= 3 for x in seen): continue
+    else:
+      fingerprint = None
+    cost = estimate_tokens(snippet) + (SNIPPET_OVERHEAD_TOKENS if j is None or i not in kept_paragraphs else 0)
+    if used + cost > budget: continue
+    used += cost
+    if j is None:
+      packed[i].extra_snippets.append(snippet)
+      snippets_kept += 1
+    else:
+      kept_paragraphs.setdefault(i, []).append(j)
+    if fingerprint is not None: seen.append(fingerprint)
+
+  # page paragraphs go back in reading order
+  for i, kept in kept_paragraphs.items(): packed[i].page_text = '\n'.join(paragraphs[i][j] for j in sorted(kept))
+
+  stats = dict(
+    tokens_before=tokens_before,
+    tokens_after=used,
+    budget=budget,
+    results_in=len(results),
+    results_out=len(packed),
+    snippets_in=sum(len(x.extra_snippets) for x in results),
+    snippets_out=snippets_kept,
+    page_paragraphs_in=sum(len(x) for x in paragraphs),
+    page_paragraphs_out=sum(len(x) for x in kept_paragraphs.values()),
+  )
+  return [packed[i] for i in order if i in packed], stats
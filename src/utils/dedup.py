@@ -0,0 +1,105 @@
+import hashlib
+import re
+import numpy as np
+from urllib.parse import parse_qsl, urlencode, urlsplit, urlunsplit
+
+TRACKING_PARAMS = {
+  'fbclid', 'gclid', 'dclid', 'gclsrc', 'msclkid', 'yclid', 'igshid', 'mc_cid', 'mc_eid',
+  '_ga', '_gl', 'ref', 'ref_src', 'ref_url', 'source', 'spm', 'amp', 'outputtype',
+}
+MOBILE_HOST_PREFIXES = ('www.', 'm.', 'mobile.', 'amp.')
+
+
+def canonicalize_url(url: str) -> str:
+  """
+  Reduces a URL to a canonical form so that trivially different links to the same page compare equal.
+
+  Drops the scheme distinction, www/mobile/AMP host prefixes, AMP path suffixes,
+  tracking query params, fragments and trailing slashes.
+
+  :param url: The URL to canonicalize.
+  :return: The canonical URL.
+  """
+  parts = urlsplit(url.strip())
+  host = (parts.hostname or '').lower()
+  path = parts.path
+
+  # google amp cache: https://example-com.cdn.ampproject.org/c/s/example.com/page
+  if host.endswith('.cdn.ampproject.org'):
+    match = re.match(r'^/[a-z](?:/s)?/([^/]+)(/.*)?$', path)
+    if match: host, path = match.group(1).lower(), match.group(2) or ''
+
+  for prefix in MOBILE_HOST_PREFIXES:
+    if host.startswith(prefix):
+      host = host[len(prefix):]
+      break
+
+  path = re.sub(r'/amp/?$', '', path)
+  path = re.sub(r'\.amp(\.html?)?$', r'\1', path)
+  path = path.rstrip('/')
+
+  query = [
+    (k, v) for k, v in parse_qsl(parts.query, keep_blank_values=True)
+    if not k.lower().startswith('utm_') and k.lower() not in TRACKING_PARAMS
+  ]
+  return urlunsplit(('', host, path, urlencode(sorted(query)), ''))
+
+
+def simhash(text: str, ngram: int = 3) -> int:
+  """
+  Computes a 64-bit SimHash over word n-gram shingles of the text.
+
+  :param text: The text to fingerprint.
+  :param ngram: Number of words per shingle.
+  :return: The fingerprint as an int.
+  """
+  words = re.findall(r'\w+', text.lower())
+  shingles = [' '.join(words[i:i + ngram]) for i in range(max(1, len(words) - ngram + 1))]
+  hashes = np.array([int.from_bytes(hashlib.blake2b(x.encode(), digest_size=8).digest(), 'big') for x in shingles], dtype=np.uint64)
+  bits = (hashes[:, None] >> np.arange(64, dtype=np.uint64)) & np.uint64(1) # shingles x 64
+  weights = 2 * bits.astype(np.int64).sum(axis=0) - len(shingles)
+  return sum(1 << int(bit) for bit in np.flatnonzero(weights > 0))
+
+
+def hamming_distance(a: int, b: int) -> int:
+  return bin(a ^ b).count('1')
+
+
+# incremental, so results can be fed in as each search completes
+class Deduper:
+  """
+  Filters out search results whose canonical URL was already seen, or whose text is
+  a near-duplicate (SimHash within max_distance bits) of an already kept result.
+
+  :param max_distance: Max hamming distance between fingerprints to count as near-duplicate.
+  :param min_words: Texts shorter than this are only deduplicated by URL.
+  """
+
+  def __init__(self, max_distance: int = 3, min_words: int = 8):
+    self.max_distance = max_distance
+    self.min_words = min_words
+    self.urls = set()
+    self.fingerprints = []
+    self.removed = 0
+
+  def add(self, result) -> bool:
+    """Returns True if the result is new and should be kept."""
+    url = canonicalize_url(result.url)
+    if url in self.urls:
+      self.removed += 1
+      return False
+
+    text = ' '.join([result.title, result.description, *result.extra_snippets])
+    fingerprint = None
+    if len(re.findall(r'\w+', text)) >= self.min_words:
+      fingerprint = simhash(text)
+      if any(hamming_distance(fingerprint, x) <= self.max_distance for x in self.fingerprints):
+        self.removed += 1
+        return False
+
+    self.urls.add(url)
+    if fingerprint is not None: self.fingerprints.append(fingerprint)
+    return True
+
+  def filter(self, results: list) -> list:
+    return [x for x in results if self.add(x)]
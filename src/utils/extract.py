@@ -0,0 +1,86 @@
+import re
+from html.parser import HTMLParser
+from typing import Optional
+
+# never main content
+SKIP_TAGS = {
+  'head', 'script', 'style', 'noscript', 'template', 'svg', 'canvas', 'iframe',
+  'nav', 'header', 'footer', 'aside', 'form', 'button', 'select', 'menu',
+}
+# end the current text block
+BLOCK_TAGS = {
+  'p', 'div', 'section', 'article', 'main', 'li', 'ul', 'ol', 'dl', 'dt', 'dd', 'br', 'hr',
+  'h1', 'h2', 'h3', 'h4', 'h5', 'h6', 'pre', 'blockquote', 'table', 'tr', 'td', 'th', 'figcaption',
+}
+
+
+class TextExtractor(HTMLParser):
+  """
+  Streaming main-text extractor: feed it HTML as it downloads and it collects the
+  page's text blocks, dropping boilerplate such as navigation, scripts, short
+  fragments and link lists.
+
+  :param min_words: Blocks with fewer words are dropped.
+  :param max_link_density: Blocks where more than this fraction of the text is link text are dropped.
+  :param max_chars: Stop collecting once this much text was kept, None for no limit.
+  """
+
+  def __init__(self, min_words: int = 6, max_link_density: float = 0.5, max_chars: Optional[int] = None):
+    super().__init__(convert_charrefs=True)
+    self.min_words = min_words
+    self.max_link_density = max_link_density
+    self.max_chars = max_chars
+    self.blocks = []
+    self.chars = 0
+    self._skip_depth = 0
+    self._link_depth = 0
+    self._block = []
+    self._link_chars = 0
+
+  @property
+  def full(self) -> bool:
+    return self.max_chars is not None and self.chars >= self.max_chars
+
+  @property
+  def text(self) -> str:
+    return '\n'.join(self.blocks)
+
+  def close(self):
+    super().close()
+    self._flush()
+
+  def handle_starttag(self, tag, attrs):
+    if tag in SKIP_TAGS: self._skip_depth += 1
+    elif tag == 'a': self._link_depth += 1
+    if tag in BLOCK_TAGS: self._flush()
+
+  def handle_startendtag(self, tag, attrs):
+    if tag in BLOCK_TAGS: self._flush()
+
+  def handle_endtag(self, tag):
+    if tag in SKIP_TAGS: self._skip_depth = max(0, self._skip_depth - 1)
+    elif tag == 'a': self._link_depth = max(0, self._link_depth - 1)
+    if tag in BLOCK_TAGS: self._flush()
+
+  def handle_data(self, data):
+    if self._skip_depth or self.full: return
+    self._block.append(data)
+    if self._link_depth: self._link_chars += len(data.strip())
+
+  def _flush(self):
+    text = ' '.join(''.join(self._block).split())
+    link_chars = self._link_chars
+    self._block = []
+    self._link_chars = 0
+    if self.full or len(text.split()) < self.min_words: return
+    if link_chars / len(text) > self.max_link_density: return
+    if self.max_chars is not None: text = text[:self.max_chars - self.chars]
+    self.blocks.append(text)
+    self.chars += len(text)
+
+
+def extract_plain_text(text: str, min_words: int = 6, max_chars: Optional[int] = None) -> str:
+  """Splits plain text into paragraphs on blank lines, keeping those of at least min_words words."""
+  blocks = [' '.join(x.split()) for x in re.split(r'\n\s*\n', text)]
+  kept = '\n'.join(x for x in blocks if len(x.split()) >= min_words)
+  return kept[:max_chars] if max_chars is not None else kept
@@ -0,0 +1,38 @@
+import aiohttp
+from typing import Optional
+
+from src import config
+
+# one pooled client per process, owned by the api lifespan / cli main
+_session: Optional[aiohttp.ClientSession] = None
+
+
+def get_session() -> aiohttp.ClientSession:
+  """
+  Returns the shared, connection-pooled HTTP session, creating it on first use.
+
+  Must be called from within a running event loop.
+
+  :return: The process-wide aiohttp.ClientSession.
+  """
+  global _session
+  if _session is None or _session.closed:
+    connector = aiohttp.TCPConnector(
+      limit=config.settings.HTTP_MAX_CONNECTIONS,
+      limit_per_host=config.settings.HTTP_MAX_CONNECTIONS_PER_HOST,
+      use_dns_cache=True,
+      ttl_dns_cache=config.settings.HTTP_DNS_CACHE_TTL,
+    )
+    timeout = aiohttp.ClientTimeout(
+      total=config.settings.HTTP_TIMEOUT,
+      connect=config.settings.HTTP_CONNECT_TIMEOUT,
+    )
+    _session = aiohttp.ClientSession(connector=connector, timeout=timeout)
+  return _session
+
+
+async def close_session():
+  """Closes the shared HTTP session, if one was opened."""
+  global _session
+  if _session is not None and not _session.closed: await _session.close()
+  _session = None
@@ -0,0 +1,117 @@
+import contextlib
+import contextvars
+import functools
+import inspect
+import time
+from dataclasses import dataclass
+from prometheus_client import CONTENT_TYPE_LATEST, Counter, Gauge, Histogram, generate_latest
+
+STAGE_LATENCY = Histogram(
+  'search_stage_seconds', 'Latency of SearchSession stages', ['stage'],
+  buckets=(0.01, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 20, 40, 80),
+)
+BRAVE_LATENCY = Histogram('brave_request_seconds', 'Latency of Brave search HTTP requests', ['status'])
+BRAVE_RETRIES = Counter('brave_retries_total', 'Brave search requests retried after a failure')
+SEARCH_PROVIDER_LATENCY = Histogram('search_provider_seconds', 'Latency of search provider requests', ['provider', 'outcome'])
+SEARCH_PROVIDER_ANSWERS = Counter('search_provider_answers_total', 'Searches answered, by the provider whose results were used', ['provider'])
+SEARCH_HEDGES = Counter('search_hedges_total', 'Slow searches raced against another provider, by the provider started', ['provider'])
+SEARCH_FAILOVERS = Counter('search_failovers_total', 'Search provider failures, by provider and HTTP status', ['provider', 'status'])
+RATE_LIMIT_WAIT = Histogram(
+  'rate_limiter_wait_seconds', 'Time spent waiting for a rate limiter token',
+  buckets=(0.001, 0.01, 0.1, 0.5, 1, 2, 5, 10, 20, 40),
+)
+LLM_CALLS = Counter('llm_calls_total', 'LLM calls made')
+LLM_RUNNING = Gauge('llm_calls_running', 'LLM calls holding a scheduler slot', ['model'])
+LLM_QUEUE_DEPTH = Gauge('llm_queue_depth', 'LLM calls waiting for a scheduler slot', ['model', 'priority'])
+LLM_QUEUE_WAIT = Histogram(
+  'llm_queue_wait_seconds', 'Time LLM calls waited for a scheduler slot', ['model', 'priority'],
+  buckets=(0.001, 0.01, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 20, 40),
+)
+LLM_TOKENS = Counter('llm_tokens_total', 'LLM tokens used', ['kind'])
+REQUEST_LLM_CALLS = Histogram(
+  'search_request_llm_calls', 'LLM calls made per search request',
+  buckets=(0, 1, 2, 5, 10, 20, 50, 100, 200),
+)
+REQUEST_LLM_TOKENS = Histogram(
+  'search_request_llm_tokens', 'LLM tokens used per search request', ['kind'],
+  buckets=(0, 1_000, 5_000, 10_000, 25_000, 50_000, 100_000, 250_000, 500_000),
+)
+PAGE_FETCHES = Counter('page_fetches_total', 'Pages requested by the page fetch stage', ['outcome'])
+PRUNE_VERDICTS = Counter('search_results_pruned_total', 'Search results judged during pruning', ['verdict'])
+PARSE_FAILURES = Counter('llm_parse_failures_total', 'LLM responses missing the expected output format', ['stage'])
+DEADLINE_DEGRADED = Counter('search_deadline_degraded_total', 'Search stages cut short by the request deadline', ['stage'])
+CASCADE_ESCALATIONS = Counter('search_cascade_escalations_total', 'Stage calls redone with the answer model', ['stage'])
+SEARCH_COALESCED = Counter('search_requests_coalesced_total', 'Search requests served by joining an identical in-flight search')
+IN_FLIGHT = Gauge('search_requests_in_flight', 'Search requests currently being served')
+
+
+@dataclass
+class RequestUsage:
+  llm_calls: int = 0
+  request_tokens: int = 0
+  response_tokens: int = 0
+
+# usage of the search request running in the current context; tasks spawned by
+# the request inherit it, so concurrent llm calls all add to the same object
+_request_usage = contextvars.ContextVar('request_usage', default=None)
+
+
+@contextlib.contextmanager
+def track_request():
+  """Marks a search request as in flight and records its llm calls and tokens when it ends."""
+  usage = RequestUsage()
+  token = _request_usage.set(usage)
+  IN_FLIGHT.inc()
+  try:
+    yield usage
+  finally:
+    IN_FLIGHT.dec()
+    # an abandoned stream may be finalized from another context; nothing left to reset then
+    with contextlib.suppress(ValueError): _request_usage.reset(token)
+    REQUEST_LLM_CALLS.observe(usage.llm_calls)
+    REQUEST_LLM_TOKENS.labels('request').observe(usage.request_tokens)
+    REQUEST_LLM_TOKENS.labels('response').observe(usage.response_tokens)
+
+
+def record_llm_call(usage=None):
+  """Counts one llm call, with its pydantic-ai Usage if known, globally and against the current request."""
+  request_tokens = (usage.request_tokens or 0) if usage is not None else 0
+  response_tokens = (usage.response_tokens or 0) if usage is not None else 0
+  LLM_CALLS.inc()
+  LLM_TOKENS.labels('request').inc(request_tokens)
+  LLM_TOKENS.labels('response').inc(response_tokens)
+
+  current = _request_usage.get()
+  if current is not None:
+    current.llm_calls += 1
+    current.request_tokens += request_tokens
+    current.response_tokens += response_tokens
+
+
+@contextlib.contextmanager
+def time_stage(stage: str):
+  start = time.perf_counter()
+  try:
+    yield
+  finally:
+    STAGE_LATENCY.labels(stage).observe(time.perf_counter() - start)
+
+
+def timed(stage: str):
+  """Decorator recording the latency of a sync or async function as a search stage."""
+  def decorator(fn):
+    if inspect.iscoroutinefunction(fn):
+      @functools.wraps(fn)
+      async def wrapper(*args, **kwargs):
+        with time_stage(stage): return await fn(*args, **kwargs)
+    else:
+      @functools.wraps(fn)
+      def wrapper(*args, **kwargs):
+        with time_stage(stage): return fn(*args, **kwargs)
+    return wrapper
+  return decorator
+
+
+def render() -> tuple[bytes, str]:
+  """Returns the current metrics in Prometheus text format, with its content type."""
+  return generate_latest(), CONTENT_TYPE_LATEST
@@ -0,0 +1,51 @@
+import re
+import numpy as np
+from typing import Optional
+
+
+def tokenize(text: str) -> list[str]:
+  return re.findall(r'\w+', text.lower())
+
+
+def bm25_scores(query: str, documents: list[str], k1: float = 1.5, b: float = 0.75) -> np.ndarray:
+  """
+  Scores every document against the query with Okapi BM25.
+
+  Term statistics are computed over the given documents only, so scores are
+  relative to the candidate batch.
+
+  :param query: The query text.
+  :param documents: The candidate documents.
+  :return: Array of scores, one per document.
+  """
+  docs = [tokenize(x) for x in documents]
+  terms = list(dict.fromkeys(tokenize(query)))
+  if not docs or not terms: return np.zeros(len(docs))
+
+  # term-frequency matrix restricted to query terms: docs x terms
+  index = {t: i for i, t in enumerate(terms)}
+  tf = np.zeros((len(docs), len(terms)))
+  for row, doc in enumerate(docs):
+    cols = [index[t] for t in doc if t in index]
+    np.add.at(tf[row], cols, 1)
+
+  doc_len = np.array([len(x) for x in docs], dtype=float)
+  avg_len = doc_len.mean() or 1.0
+  df = (tf > 0).sum(axis=0)
+  idf = np.log1p((len(docs) - df + 0.5) / (df + 0.5))
+  norm = k1 * (1 - b + b * doc_len / avg_len)
+  return (idf * tf * (k1 + 1) / (tf + norm[:, None])).sum(axis=1)
+
+
+def shortlist(query: str, documents: list[str], top_k: Optional[int] = None, min_score: float = 0.0) -> list[tuple[int, float]]:
+  """
+  Ranks documents against the query and keeps the best ones.
+
+  :param top_k: Keep at most this many documents, None for no limit.
+  :param min_score: Drop documents scoring below this.
+  :return: (document index, score) pairs, best first.
+  """
+  scores = bm25_scores(query, documents)
+  order = np.argsort(-scores, kind='stable')
+  kept = [(int(i), float(scores[i])) for i in order if scores[i] >= min_score]
+  return kept if top_k is None else kept[:top_k]
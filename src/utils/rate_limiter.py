@@ -1,24 +1,106 @@
 import asyncio
+import fcntl
+import hashlib
+import json
+import os
+import time
+from typing import Optional
 
 # token-bucket algorithm
+#
+# tokens are reserved up front: a caller takes its tokens immediately, letting the
+# balance go negative, and sleeps exactly until the bucket would have refilled that
+# far. callers are therefore served in arrival order and nobody polls.
+#
+# a cancelled waiter only gives its tokens back when nobody reserved after it: later
+# waiters already sleep until a slot behind its one, so a refund would let the next
+# caller in at the same moment as one of them.
 class RateLimiter:
-  def __init__(self, rate: int, capacity: int):
+  def __init__(self, rate: float, capacity: int):
     self.rate = rate # tokens per second
     self.capacity = capacity # max tokens in bucket
     self.tokens = capacity
-    self.last_refill = asyncio.get_event_loop().time()
+    self.last_refill = time.monotonic()
+    self.reservations = 0 # waiting reservations made so far
 
   async def acquire(self, num_tokens: int = 1):
-    while True:
-      self.refill()
-      if self.tokens >= num_tokens:
-        self.tokens -= num_tokens
-        return
-      await asyncio.sleep(0.1) # check every 100ms
+    self.refill()
+    self.tokens -= num_tokens
+    if self.tokens >= 0: return
+    self.reservations += 1
+    reservation = self.reservations
+    try:
+      await asyncio.sleep(-self.tokens / self.rate)
+    except asyncio.CancelledError:
+      if reservation == self.reservations: self.tokens += num_tokens
+      raise
 
   def refill(self):
-    now = asyncio.get_event_loop().time()
+    now = time.monotonic()
     elapsed = now - self.last_refill
     new_tokens = elapsed * self.rate
     self.tokens = min(self.capacity, self.tokens + new_tokens)
     self.last_refill = now
+
+
+# same bucket, but the state lives in a flock-ed file so that every worker
+# process on the host draws from one budget
+class FileRateLimiter:
+  def __init__(self, path: str, rate: float, capacity: int):
+    self.path = path
+    self.rate = rate
+    self.capacity = capacity
+    os.makedirs(os.path.dirname(path) or '.', exist_ok=True)
+
+  async def acquire(self, num_tokens: int = 1):
+    wait, reservation = await asyncio.to_thread(self._update, -num_tokens)
+    if wait <= 0: return
+    try:
+      await asyncio.sleep(wait)
+    except asyncio.CancelledError:
+      await asyncio.shield(asyncio.to_thread(self._update, num_tokens, reservation))
+      raise
+
+  def _update(self, delta: float, refund_of: Optional[int] = None) -> tuple[float, int]:
+    """
+    Applies delta to the shared balance and returns how long the caller must wait,
+    and the number of its reservation if it has to. A refund (refund_of set) is only
+    applied if no reservation was made after that one.
+    """
+    with open(self.path, 'a+') as f:
+      fcntl.flock(f, fcntl.LOCK_EX)
+      try:
+        f.seek(0)
+        raw = f.read()
+        now = time.time()
+        state = json.loads(raw) if raw else dict(tokens=self.capacity, last_refill=now)
+        reservations = state.get('reservations', 0)
+        if refund_of is not None and refund_of != reservations: delta = 0
+        elapsed = max(0.0, now - state['last_refill'])
+        tokens = min(self.capacity, state['tokens'] + elapsed * self.rate) + delta
+        if tokens < 0 and refund_of is None: reservations += 1
+        f.seek(0)
+        f.truncate()
+        json.dump(dict(tokens=tokens, last_refill=now, reservations=reservations), f)
+        f.flush()
+      finally:
+        fcntl.flock(f, fcntl.LOCK_UN)
+    return (-tokens / self.rate if tokens < 0 else 0.0), reservations
+
+
+_limiters: dict = {}
+
+def get_rate_limiter(key: str, rate: float, capacity: int, shared_dir: Optional[str] = None):
+  """
+  Returns the limiter for the given key (e.g. an API key), creating it on first use.
+
+  Every caller using the same key shares one budget. When shared_dir is set the
+  budget is also shared with other processes on the host through a lock file.
+  """
+  if key not in _limiters:
+    if shared_dir:
+      name = hashlib.sha256(key.encode()).hexdigest()[:16]
+      _limiters[key] = FileRateLimiter(os.path.join(shared_dir, f'{name}.json'), rate, capacity)
+    else:
+      _limiters[key] = RateLimiter(rate, capacity)
+  return _limiters[key]
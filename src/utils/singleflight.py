@@ -0,0 +1,90 @@
+import asyncio
+from typing import AsyncIterator, Callable, Hashable
+
+
+class Flight:
+  """
+  One running stream, shared by every subscriber.
+
+  The producer runs in its own task, so a client disconnecting doesn't cut the
+  stream for the others. Chunks are kept until the flight ends so late joiners can
+  be replayed from the start. The producer is cancelled once nobody is listening.
+  """
+
+  def __init__(self, factory: Callable[[], AsyncIterator], on_done: Callable[[], None]):
+    self.chunks = []
+    self.done = False
+    self.error = None
+    self.subscribers = 0
+    self._on_done = on_done
+    self._changed = asyncio.Event()
+    self._task = asyncio.create_task(self._run(factory))
+
+  async def _run(self, factory):
+    try:
+      async for chunk in factory():
+        self.chunks.append(chunk)
+        self._notify()
+    except asyncio.CancelledError:
+      raise
+    except Exception as e:
+      self.error = e
+    finally:
+      self.done = True
+      self._on_done()
+      self._notify()
+
+  def _notify(self):
+    self._changed.set()
+    self._changed = asyncio.Event()
+
+  def subscribe(self) -> AsyncIterator:
+    # counted now rather than once iteration starts, so another subscriber leaving in
+    # between can't cancel the producer out from under this one
+    self.subscribers += 1
+    return self._read()
+
+  async def _read(self) -> AsyncIterator:
+    try:
+      i = 0
+      while True:
+        if i < len(self.chunks):
+          yield self.chunks[i]
+          i += 1
+        elif self.done:
+          if self.error is not None: raise self.error
+          return
+        else:
+          await self._changed.wait()
+    finally:
+      self.subscribers -= 1
+      if not self.subscribers and not self.done:
+        self._task.cancel()
+        self._on_done()
+
+
+class SingleFlight:
+  """
+  Coalesces identical concurrent streams: the first caller for a key starts the
+  producer, and everyone asking for the same key while it runs gets the same chunks,
+  including the ones sent before they joined.
+  """
+
+  def __init__(self):
+    self._flights: dict[Hashable, Flight] = {}
+
+  def stream(self, key: Hashable, factory: Callable[[], AsyncIterator]) -> AsyncIterator:
+    flight = self._flights.get(key)
+    if flight is None:
+      flight = Flight(factory, lambda: self._forget(key, flight))
+      self._flights[key] = flight
+    return flight.subscribe()
+
+  def _forget(self, key, flight):
+    if self._flights.get(key) is flight: del self._flights[key]
+
+  def __contains__(self, key):
+    return key in self._flights
+
+  def __len__(self):
+    return len(self._flights)
@@ -0,0 +1,86 @@
+import re
+from typing import Optional
+
+TAG = re.compile(r'<([A-Za-z_][\w-]*)>')
+MAX_TAG_LENGTH = 64
+
+
+class SectionStreamParser:
+  """
+  Incrementally splits a streamed response made of top-level <section>...</section>
+  blocks into (section, text) events, as the text arrives.
+
+  Content is forwarded as soon as it can't be part of the closing tag, with
+  whitespace at the start and end of every section trimmed. Tags nested inside a
+  section are passed through as text. Text outside any section is reported as is,
+  with section None.
+  """
+
+  def __init__(self):
+    self.section: Optional[str] = None
+    self._buffer = ''
+    self._at_start = True # nothing emitted yet for the current section
+
+  def feed(self, chunk: str) -> list[tuple[Optional[str], str]]:
+    self._buffer += chunk
+    events = []
+    while self._buffer:
+      if self.section is None:
+        if not self._open_section(events): break
+      elif not self._read_section(events):
+        break
+    return [x for x in events if x[1]]
+
+  def close(self) -> list[tuple[Optional[str], str]]:
+    """Flushes whatever is left once the stream has ended, e.g. an unterminated section."""
+    text = self._buffer
+    if self.section is not None: text = text.strip() if self._at_start else text.rstrip()
+    self._buffer = ''
+    return [(self.section, text)] if text else []
+
+  def _open_section(self, events) -> bool:
+    start = self._buffer.find('<')
+    if start == -1:
+      events.append((None, self._buffer))
+      self._buffer = ''
+      return False
+
+    events.append((None, self._buffer[:start]))
+    self._buffer = self._buffer[start:]
+    match = TAG.match(self._buffer)
+    if match:
+      self.section = match.group(1)
+      self._at_start = True
+      self._buffer = self._buffer[match.end():]
+      return True
+
+    end = self._buffer.find('>')
+    if end == -1 and len(self._buffer) < MAX_TAG_LENGTH: return False # tag may still be arriving
+    # not an opening tag (stray closing tag, or a literal '<'), pass it through
+    cut = end + 1 if end != -1 else 1
+    events.append((None, self._buffer[:cut]))
+    self._buffer = self._buffer[cut:]
+    return True
+
+  def _read_section(self, events) -> bool:
+    closing = f'</{self.section}>'
+    end = self._buffer.find(closing)
+    if end != -1:
+      text = self._buffer[:end]
+      events.append((self.section, text.strip() if self._at_start else text.rstrip()))
+      self._buffer = self._buffer[end + len(closing):]
+      self.section = None
+      return True
+
+    # hold back anything that could be the start of the closing tag, plus trailing
+    # whitespace, which is dropped if the section ends right after it
+    hold = next((n for n in range(min(len(closing), len(self._buffer)), 0, -1) if closing.startswith(self._buffer[-n:])), 0)
+    text = self._buffer[:len(self._buffer) - hold]
+    stripped = text.rstrip()
+    hold += len(text) - len(stripped)
+    if self._at_start: stripped = stripped.lstrip()
+    if stripped:
+      events.append((self.section, stripped))
+      self._at_start = False
+    self._buffer = self._buffer[len(self._buffer) - hold:] if hold else ''
+    return False